@@ -0,0 +1,120 @@
+import machinery as ma
+from generic import lty
+
+# numpy is optional (see requirements.txt); log2log reduce needs it
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+# ------------------------------------------------------------------------------
+
+# Counts of the entries of several logs as matrices with one row per key and
+# one column per log (keys and logs as in the LogSet of the logs). Counts of
+# logs that do not have a key are 0. Keys with entries that are inconsistent
+# between the logs (see LogEntry.check_const()) are dropped. The matrices are
+# integer if all counts are, and floating point otherwise. The matrices are
+# filled entry by entry (with the consistency checks), only the reductions
+# work on whole arrays.
+class Counts:
+  """Counts of tests across logs"""
+
+  def __init__(self, logs):
+    ma.chk(np is not None, 'numpy is needed for aggregating logs (see\
+ requirements.txt)')
+    ls = ma.get_log_set(logs)
+    self.ls = ls
+    self.n = len(ls)
+    keys = []
+    # Entries from which the aggregated entries are derived
+    self.base = []
+    pos = []
+    neg = []
+    total = []
+    present = []
+    for k in ls.get_keys():
+      ler = ls.get_entry(k)
+      les = ls.get_entries(k)
+      try:
+        for le in les:
+          if le:
+            ler.check_const(le)
+      except ma.InconsistentTestsError as e:
+        print(e)
+        continue
+      keys.append(k)
+      self.base.append(ler)
+      pos.append([le.pos if le else 0 for le in les])
+      neg.append([le.neg if le else 0 for le in les])
+      total.append([le.total if le else 0 for le in les])
+      present.append([bool(le) for le in les])
+
+    self.keys = keys
+    shape = (len(keys), self.n)
+    self.pos = np.array(pos).reshape(shape)
+    self.neg = np.array(neg).reshape(shape)
+    self.total = np.array(total).reshape(shape)
+    self.present = np.array(present, dtype=bool).reshape(shape)
+
+  #######################
+  # Row-wise reductions #
+  #######################
+
+  # The logs are added one after the other (rather than with np.sum()) such
+  # that the results are the same as when adding up the entries in a loop
+
+  ### Sum of the columns of matrix a
+  def sum(self, a):
+    acc = np.zeros(a.shape[0], dtype=a.dtype)
+    for j in range(self.n):
+      acc = acc + a[:, j]
+    return acc
+
+  ### Per key, the log with the maximum (or minimum) number of positive
+  # outcomes; of several such logs the first
+  def arg_pos(self, f):
+    # Missing entries never win
+    fill = -np.inf if f == np.argmax else np.inf
+    return f(np.where(self.present, self.pos, fill), axis=1)
+
+  ### Pick the counts of one log per key
+  def pick(self, j):
+    i = np.arange(len(self.keys))
+    return self.pos[i, j], self.neg[i, j], self.total[i, j]
+
+  ###############
+  # Aggregation #
+  ###############
+
+  ### Log of aggregated entries
+  # pos, neg, total: per key (arrays)
+  # parent: parent of the entries, and filename of the log
+  def to_log(self, lh, pos, neg, total, parent):
+    log = lh()
+    log.fn = parent
+    # Python numbers, such that the entries are as if computed in a loop
+    for k, le, p, n, t in zip(self.keys, self.base, pos.tolist(), neg.tolist(),
+      total.tolist()):
+      e = le.get_aggregate(parent)
+      e.pos = p
+      e.neg = n
+      e.total = t
+      log.d[k] = e
+    return log
+
+# Reductions over the logs by name; each takes the counts and returns the
+# arrays of pos, neg, and total per key
+reductions = {
+  # Sum of the counts
+  'sum': lambda c: (c.sum(c.pos), c.sum(c.neg), c.sum(c.total)),
+  # Counts of the log with the most/fewest positive outcomes
+  'max': lambda c: c.pick(c.arg_pos(np.argmax)),
+  'min': lambda c: c.pick(c.arg_pos(np.argmin)),
+}
+
+### Aggregate logs with the reduction of the given name
+def reduce_logs(logs, lh, name):
+  assert(lty(logs, lh))
+  c = Counts(logs)
+  pos, neg, total = reductions[name](c)
+  return c.to_log(lh, pos, neg, total, name)
@@ -22,15 +22,16 @@ elif [ ! -z $1 ]; then
 fi
 
 
+# Parsed logs are cached in $LOG_CACHE (if set), so redoing this is cheap
 for f in "$D"/*.txt
 do
-  if [ ! -f $f.norm ]; then
+  if [ ! -f $f.norm ] || [ $f -nt $f.norm ]; then
     $l2l $OPT normalize $f.norm $f
-    $l2l $OPT pickle $f.pkl $f.norm
+    $l2l $OPT store $f.pkl $f.norm
     continue
   fi
-  if [ ! -f $f.pkl ]; then
-    $l2l $OPT pickle $f.pkl $f.norm
+  if [ ! -f $f.pkl ] || [ $f.norm -nt $f.pkl ]; then
+    $l2l $OPT store $f.pkl $f.norm
   fi
 done
 
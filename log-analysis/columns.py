@@ -0,0 +1,247 @@
+import machinery as ma
+from generic import lty
+
+# numpy is optional; without it key selection falls back to Rows below
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+# ------------------------------------------------------------------------------
+
+# Bits of the memory class column (see LogEntry.get_mem())
+mem_global = ma.LogEntry.mem_global_bit
+mem_shared = ma.LogEntry.mem_shared_bit
+
+### Get key selection view over the logs (columnar if numpy is available)
+# logs: list of logs or LogSet
+def get_view(logs, ks=None):
+  if np is None:
+    return Rows(logs, ks)
+  return Columns(logs, ks)
+
+# ------------------------------------------------------------------------------
+
+# The views below provide the key selection functions of machinery as methods.
+# Filters passed to get_filtered_keys() are called with a log entry (Rows) or
+# with the whole view (Columns), so they must only use the predicates that both
+# provide, and combine them with & and | (not 'and' and 'or'), e.g.:
+#
+#   lambda e: e.is_warp() & e.is_global()
+#
+# Compiled filter expressions (see filters.py) can be passed as well.
+
+class Rows:
+  """Key selection over log entries"""
+
+  def __init__(self, logs, ks=None):
+    self.logs = ma.get_log_set(logs)
+    if ks == None:
+      ks = self.logs.get_keys()
+    self.keys = ks
+
+  def get_keys(self):
+    return list(self.keys)
+
+  def get_matching_keys(self, regexes, ks=None):
+    if ks == None:
+      ks = self.keys
+    return ma.get_matching_keys(regexes, self.logs, ks)
+
+  def get_classified_keys(self, classes, ks=None):
+    if ks == None:
+      ks = self.keys
+    return ma.get_classified_keys(classes, self.logs, ks)
+
+  def get_filtered_keys(self, filt, ks=None):
+    if ks == None:
+      ks = self.keys
+    return ma.get_filtered_keys(filt, self.logs, ks)
+
+  def get_pos_keys(self, ks=None):
+    if ks == None:
+      ks = self.keys
+    return ma.get_pos_keys(self.logs, ks)
+
+class Columns:
+  """Columnar view of logs"""
+
+  # Each key has one row; categorical and numeric columns are taken from the
+  # entry of the first log that has the key (as with machinery.get_entry()),
+  # except for anypos, which is set when any log has a positive entry
+
+  def __init__(self, logs, ks=None):
+    assert(np is not None)
+    ls = ma.get_log_set(logs)
+    if ks == None:
+      ks = ls.get_keys()
+    self.keys = ks
+    self.index = dict((k, i) for i, k in enumerate(ks))
+    assert(len(self.index) == len(ks))
+
+    n = len(ks)
+    self.pos = np.zeros(n, dtype=np.float64)
+    self.neg = np.zeros(n, dtype=np.float64)
+    self.total = np.zeros(n, dtype=np.int64)
+    self.anypos = np.zeros(n, dtype=bool)
+    self.scope = np.zeros(n, dtype=np.int8)
+    self.mem = np.zeros(n, dtype=np.uint8)
+    self.flags = np.zeros(n, dtype=np.uint8)
+
+    names = []
+    short_names = []
+    for i, k in enumerate(ks):
+      le = ls.get_entry(k)
+      for e in ls.get_entries(k):
+        if e and e.is_pos():
+          self.anypos[i] = True
+          break
+      self.pos[i] = le.pos
+      self.neg[i] = le.neg
+      self.total[i] = le.total
+      self.scope[i] = le.get_st().scope
+      self.mem[i] = le.get_mem()
+      self.flags[i] = le.flags
+      names.append(le.name)
+      short_names.append(le.short_name)
+
+    # Categorical columns: codes into the sorted unique values
+    self.name_cats, self.name = self.categorize(names)
+    self.short_name_cats, self.short_name = self.categorize(short_names)
+
+    # Classes of the keys per tuple of classes (see get_classes())
+    self.classes = dict()
+    # Masks of filter expressions and their subexpressions (see get_mask())
+    self.masks = dict()
+
+  def categorize(self, l):
+    if not l:
+      return [], np.zeros(0, dtype=np.int64)
+    cats, codes = np.unique(np.array(l, dtype=object), return_inverse=True)
+    return list(cats), codes.reshape(-1)
+
+  #########
+  # Masks #
+  #########
+
+  def none(self):
+    return np.zeros(len(self.keys), dtype=bool)
+
+  ### Mask of (normalized) filter expression s, computed with f on first use
+  # (see filters.py)
+  def get_mask(self, s, f):
+    m = self.masks.get(s)
+    if m is None:
+      m = f()
+      self.masks[s] = m
+    return m
+
+  ### Mask of a categorical column from a predicate on its values
+  def cat_mask(self, cats, codes, f):
+    hit = np.array([f(c) for c in cats], dtype=bool)
+    if not len(hit):
+      return self.none()
+    return hit[codes]
+
+  # Scope predicates
+
+  def is_thread(self):
+    return self.scope == ma.Scope.thread
+
+  def is_warp(self):
+    return self.scope == ma.Scope.warp
+
+  def is_cta(self):
+    return self.scope == ma.Scope.cta
+
+  def is_ker(self):
+    return self.scope == ma.Scope.ker
+
+  def is_dev(self):
+    return self.scope == ma.Scope.dev
+
+  def is_mixed_scope(self):
+    return self.scope == ma.Scope.mixed
+
+  # Memory predicates
+
+  def is_global(self):
+    return (self.mem & mem_global) != 0
+
+  def is_shared(self):
+    return (self.mem & mem_shared) != 0
+
+  def is_mixed_mem(self):
+    return self.mem == 0
+
+  # Incantation predicates
+
+  def is_general_bc(self):
+    return (self.flags & ma.LogEntry.general_bc_bit) != 0
+
+  def is_mem_stress(self):
+    return (self.flags & ma.LogEntry.mem_stress_bit) != 0
+
+  def is_rand_threads(self):
+    return (self.flags & ma.LogEntry.rand_threads_bit) != 0
+
+  def is_barrier(self):
+    return (self.flags & ma.LogEntry.barrier_bit) != 0
+
+  # Other predicates
+
+  # Like the other predicates, of the entry of the first log that has the key
+  # (as LogEntry.is_pos() on machinery.get_entry()), whereas any_pos() and
+  # get_pos_keys() take all logs into account (as machinery.get_pos_keys())
+  def is_pos(self):
+    return self.pos > 0
+
+  def any_pos(self):
+    return self.anypos
+
+  def does_match(self, rl):
+    assert(lty(rl, str))
+    km = ma.get_key_matcher([rl])
+    return self.cat_mask(self.name_cats, self.name,
+      lambda n: km.classify(n) == 0)
+
+  def simple_match(self, s):
+    assert(type(s) == str)
+    s = s.lower()
+    return self.cat_mask(self.short_name_cats, self.short_name,
+      lambda n: n.lower() == s)
+
+  #################
+  # Key selection #
+  #################
+
+  ### Keys of the mask, in the order of ks (or of all keys)
+  def select(self, m, ks=None):
+    if ks == None:
+      return [self.keys[i] for i in np.flatnonzero(m)]
+    return [k for k in ks if m[self.index[k]]]
+
+  def get_keys(self):
+    return list(self.keys)
+
+  ### Classes of all keys (see machinery.KeyMatcher)
+  def get_classes(self, classes):
+    t = tuple(map(tuple, classes))
+    cl = self.classes.get(t)
+    if cl is None:
+      cl = np.array(ma.classify_keys(classes, self.keys), dtype=np.int64)
+      self.classes[t] = cl
+    return cl
+
+  def get_matching_keys(self, regexes, ks=None):
+    return self.select(self.get_classes([regexes]) == 0, ks)
+
+  def get_classified_keys(self, classes, ks=None):
+    cl = self.get_classes(classes)
+    return [self.select(cl == i, ks) for i in range(len(classes))]
+
+  def get_filtered_keys(self, filt, ks=None):
+    return self.select(filt(self), ks)
+
+  def get_pos_keys(self, ks=None):
+    return self.select(self.anypos, ks)
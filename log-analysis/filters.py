@@ -0,0 +1,306 @@
+import re
+import machinery as ma
+
+# ------------------------------------------------------------------------------
+
+# Filter expressions select log entries by their attributes, e.g.:
+#
+#   scope=warp & mem=global & name~'MP'
+#
+# Grammar (whitespace is ignored):
+#   expr := conj ('|' conj)*
+#   conj := neg ('&' neg)*
+#   neg := '!' neg | '(' expr ')' | atom
+#   atom := attr | attr '=' value | attr '!=' value | 'name' '~' value
+#   value := word | 'string' | "string"
+#
+# Attributes:
+#   scope: thread, warp, cta, ker, dev, or mixed (see LogEntry.get_st())
+#   mem: global, shared, or mixed (see LogEntry.is_global())
+#   name: test name (=: equal, ~: regular expression matching at the start)
+#   short: short test name, case-insensitive (see LogEntry.simple_match())
+#   general_bc, mem_stress, rand_threads, barrier: incantations (no value)
+#   pos: test was observed (no value; in the first log that has the test, see
+#     LogEntry.is_pos())
+#
+# An expression compiles to a plan (see Filter) that is evaluated on a log
+# entry or on a columnar view (see columns.py). Conjunctions and disjunctions
+# evaluate their cheapest operands first, and a view keeps the masks of all
+# subexpressions, so sections that share a subexpression compute it once.
+
+# Thrown if an expression is malformed
+class FilterError(Exception):
+  def __init__(self, s):
+    self.s = s
+  def __repr__(self):
+    return self.s
+  def __str__(self):
+    return self.s
+
+# Predicates by attribute and value (names of methods of LogEntry and of the
+# views)
+scopes = {
+  'thread': 'is_thread',
+  'warp': 'is_warp',
+  'cta': 'is_cta',
+  'ker': 'is_ker',
+  'dev': 'is_dev',
+  'mixed': 'is_mixed_scope'
+}
+
+mems = {
+  'global': 'is_global',
+  'shared': 'is_shared',
+  'mixed': 'is_mixed_mem'
+}
+
+# Attributes without value
+flags = {
+  'general_bc': 'is_general_bc',
+  'mem_stress': 'is_mem_stress',
+  'rand_threads': 'is_rand_threads',
+  'barrier': 'is_barrier',
+  'pos': 'is_pos'
+}
+
+# Relative cost of evaluating an atom by attribute
+costs = {
+  'scope': 1,
+  'mem': 1,
+  'short': 2,
+  'name': 3
+}
+
+##########
+# Parser #
+##########
+
+tokens = re.compile(r'\s*(?:(!=|[=~&|!()])|([\w.+\-:*]+)|\'([^\']*)\'|"([^"]*)")')
+
+# Returns: list of (kind, text) with kind 'op', 'word', or 'str'
+def tokenize(s):
+  l = []
+  i = 0
+  s = s.rstrip()
+  while i < len(s):
+    m = tokens.match(s, i)
+    if not m:
+      raise FilterError('invalid filter expression at: ' + s[i:])
+    op, w, s1, s2 = m.groups()
+    if op != None:
+      l.append(('op', op))
+    elif w != None:
+      l.append(('word', w))
+    else:
+      l.append(('str', s1 if s1 != None else s2))
+    i = m.end()
+  return l
+
+# Nodes of a plan are tuples (op, s, cost, arg), with op one of 'and', 'or',
+# 'not', 'atom'; s is the normalized expression of the node; arg is the list
+# of operands, the operand, or the predicate (taking a log entry or a view)
+class Parser:
+  """Parser of filter expressions"""
+
+  def __init__(self, s):
+    self.s = s
+    self.l = tokenize(s)
+    self.i = 0
+
+  def peek(self):
+    if self.i < len(self.l):
+      return self.l[self.i]
+    return (None, None)
+
+  def next(self):
+    t = self.peek()
+    if t[0] == None:
+      self.error('unexpected end')
+    self.i += 1
+    return t
+
+  def error(self, msg):
+    raise FilterError(msg + ' in filter expression: ' + self.s)
+
+  def parse(self):
+    n = self.expr()
+    if self.peek()[0] != None:
+      self.error('unexpected ' + self.peek()[1])
+    return n
+
+  def expr(self):
+    l = [self.conj()]
+    while self.peek() == ('op', '|'):
+      self.next()
+      l.append(self.conj())
+    return junction('or', l)
+
+  def conj(self):
+    l = [self.neg()]
+    while self.peek() == ('op', '&'):
+      self.next()
+      l.append(self.neg())
+    return junction('and', l)
+
+  def neg(self):
+    t = self.peek()
+    if t == ('op', '!'):
+      self.next()
+      return negation(self.neg())
+    if t == ('op', '('):
+      self.next()
+      n = self.expr()
+      if self.next() != ('op', ')'):
+        self.error('missing )')
+      return n
+    return self.atom()
+
+  def atom(self):
+    kind, a = self.next()
+    if kind != 'word':
+      self.error('expected attribute, got ' + a)
+    # Attributes without value
+    if a in flags:
+      m = flags[a]
+      return atom(a, 1, lambda x: getattr(x, m)())
+    kind, op = self.next()
+    if kind != 'op' or op not in ['=', '!=', '~']:
+      self.error('expected =, !=, or ~ after ' + a)
+    kind, v = self.next()
+    if kind not in ['word', 'str']:
+      self.error('expected value after ' + a + op)
+    if op == '~':
+      if a != 'name':
+        self.error('~ only applies to name')
+      try:
+        re.compile(v)
+      except re.error:
+        self.error('invalid regular expression ' + v)
+      n = atom(a + "~'" + v + "'", costs[a], lambda x: x.does_match([v]))
+      return n
+    if a == 'scope' or a == 'mem':
+      d = scopes if a == 'scope' else mems
+      if v not in d:
+        self.error('invalid value ' + v + ' of ' + a)
+      m = d[v]
+      n = atom(a + '=' + v, costs[a], lambda x: getattr(x, m)())
+    elif a == 'name':
+      r = re.escape(v) + '$'
+      n = atom(a + "='" + v + "'", costs[a], lambda x: x.does_match([r]))
+    elif a == 'short':
+      n = atom(a + "='" + v + "'", costs[a], lambda x: x.simple_match(v))
+    else:
+      self.error('unknown attribute ' + a)
+    if op == '!=':
+      n = negation(n)
+    return n
+
+###########
+# Planner #
+###########
+
+def atom(s, cost, f):
+  return ('atom', s, cost, f)
+
+def negation(n):
+  # Double negation
+  if n[0] == 'not':
+    return n[3]
+  s = n[1]
+  if n[0] != 'atom':
+    s = '(' + s + ')'
+  return ('not', '!' + s, n[2], n)
+
+# Conjunction or disjunction: nested operands of the same kind are flattened,
+# duplicate operands are dropped, and the operands are ordered by cost (the
+# order of operands of equal cost is kept)
+def junction(op, l):
+  ops = []
+  for n in l:
+    if n[0] == op:
+      ops += n[3]
+    else:
+      ops.append(n)
+  seen = set()
+  l = []
+  for n in ops:
+    if n[1] not in seen:
+      seen.add(n[1])
+      l.append(n)
+  if len(l) == 1:
+    return l[0]
+  l.sort(key=lambda n: n[2])
+  sep = ' & ' if op == 'and' else ' | '
+  # Disjunctions bind weaker than conjunctions
+  s = sep.join([('(' + n[1] + ')') if op == 'and' and n[0] == 'or' else n[1]
+    for n in l])
+  return (op, s, sum([n[2] for n in l]), l)
+
+##############
+# Evaluation #
+##############
+
+# Evaluate plan on a log entry
+def evaluate_entry(n, e):
+  op = n[0]
+  if op == 'atom':
+    return bool(n[3](e))
+  if op == 'not':
+    return not evaluate_entry(n[3], e)
+  if op == 'and':
+    return all(evaluate_entry(c, e) for c in n[3])
+  assert(op == 'or')
+  return any(evaluate_entry(c, e) for c in n[3])
+
+# Evaluate plan on a view (masks are kept by the view, see get_mask())
+def evaluate_view(n, v):
+  def f():
+    op = n[0]
+    if op == 'atom':
+      return n[3](v)
+    if op == 'not':
+      return ~evaluate_view(n[3], v)
+    ms = [evaluate_view(c, v) for c in n[3]]
+    m = ms[0]
+    for m1 in ms[1:]:
+      m = (m & m1) if op == 'and' else (m | m1)
+    return m
+  return v.get_mask(n[1], f)
+
+class Filter:
+  """Compiled filter expression"""
+
+  def __init__(self, s):
+    self.s = s
+    self.plan = Parser(s).parse()
+
+  # Takes a log entry (returns bool) or a columnar view (returns mask)
+  def __call__(self, e):
+    if isinstance(e, ma.LogEntry):
+      return evaluate_entry(self.plan, e)
+    return evaluate_view(self.plan, e)
+
+  def __repr__(self):
+    return self.plan[1]
+
+# Compiled filters by expression
+compiled = dict()
+
+### Get (shared) compiled filter of expression
+def get_filter(s):
+  f = compiled.get(s)
+  if f == None:
+    f = Filter(s)
+    compiled[s] = f
+  return f
+
+### Same as above, but exit with an error if the expression is malformed
+def get_filter_chk(s):
+  try:
+    return get_filter(s)
+  except FilterError as e:
+    ma.bail(str(e))
+
+### Expression matching names against any of the regular expressions
+def name_expr(rl):
+  return "name~'" + '|'.join(rl) + "'"
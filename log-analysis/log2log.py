@@ -2,9 +2,11 @@
 
 import argparse
 import sys
-import copy
-from functools import reduce, partial
+import collections
+from functools import partial
 import machinery as ma
+import filters as fi
+import aggregate as ag
 from machinery import ErrMsg, chk, bail
 from machinery import LogEntry as L
 from generic import lty, tty, lins, tins, either_ty, ljcut, dupchk, listify
@@ -28,15 +30,23 @@ def mux(f, args):
     l.append(args.output)
   chk(not dupchk(l), 'duplicate files given')
 
-  if f != normalize:
-    # Get logs (normalize uses special options for this)
+  counts = f == cmp or f == assert_relation
+  keys = f == dump and args.keys
+  if f != normalize and f != sum and not counts and not keys:
+    # Get logs (normalize uses special options for this, sum reads them entry
+    # by entry, cmp and assert only read the counts of the entries, and dump
+    # -k only the keys)
     c = type(inp) is list
     if not c:
       inp = [inp]
-    inp = ma.get_logs(inp, lh=args.lh)
+    inp = ma.get_logs(inp, lh=args.lh, jobs=args.jobs,
+      mapped=args.mapped, cache=args.cache)
     if not c:
       inp = inp[0]
     args.input = inp
+  elif counts:
+    args.input = [ma.get_log_counts(fn, args.lh, args.jobs, args.mapped,
+      args.cache) for fn in inp]
 
   f(args)
 
@@ -47,7 +57,11 @@ def mux(f, args):
 # Dump internal representation of log (for debugging)
 def dump(args):
   log = args.input
-  if args.internal:
+  if args.keys:
+    ks = ma.get_log_keys(log, args.lh, args.jobs, args.mapped, args.cache)
+    for k in ks:
+      print(k)
+  elif args.internal:
     log.dump()
   elif args.raw:
     log.dump_raw()
@@ -58,12 +72,12 @@ def dump(args):
 def parse(args):
   pass
 
-# Pickle log object
-def pickle(args):
+# Write log to log store
+def store(args):
   log = args.input
   assert(isinstance(log, ma.Log))
   out = args.output
-  ma.gherkin(log, out)
+  ma.write_store(log, out)
 
 # Fix names in log
 def fix(args):
@@ -71,7 +85,7 @@ def fix(args):
   assert(isinstance(log, ma.Log))
   log.fix()
   out = args.output
-  ma.gherkin(log, out)
+  ma.write_store(log, out)
 
 # Sort log by name of litmus tests
 def sort(args):
@@ -79,15 +93,22 @@ def sort(args):
   assert(isinstance(log, ma.Log))
   log.sort()
   out = args.output
-  ma.gherkin(log, out)
+  ma.write_store(log, out)
 
-# Produce sum of a list of logs (drop inconsistent entries)
+# Produce sum of a list of logs (drop inconsistent entries); log stores are
+# read and the sum is written entry by entry, so that memory use does not grow
+# with the size of the logs
 def sum(args):
-  logs = args.input
-  assert(lins(logs, ma.Log))
-  log = sum_hlp(logs, args.lh)
+  fs = args.input
+  assert(lty(fs, str))
+  chk(len(fs) >= 2, 'need to provide at least two logs')
+  its = [ma.get_entry_stream(f, args.lh, args.jobs, args.mapped, args.cache)
+    for f in fs]
   out = args.output
-  ma.gherkin(log, out)
+  w = ma.StoreWriter(out, 'sum', args.lh)
+  for k, le in sum_entries(its):
+    w.add(k, le)
+  w.close()
 
 # Merge two litmus logs (for duplicate entries, pick one and drop others)
 def merge(args):
@@ -95,14 +116,13 @@ def merge(args):
   assert(lins(logs, ma.Log))
   chk(len(logs) >= 2, 'need to provide at least two input files')
 
-  ks = ma.get_keys(logs)
+  ls = ma.LogSet(logs)
   merge_log = args.lh()
   merge_log.fn = args.new_name
 
-  for k in ks:
+  for k in ls.get_keys():
     drop = False
-    for log in logs:
-      le = log.get(k)
+    for le in ls.get_entries(k):
       if le:
         if drop:
           print('dropping test ' + le.name + ' as seen previously')
@@ -111,7 +131,7 @@ def merge(args):
         drop = True
 
   out = args.output
-  ma.gherkin(merge_log, out)
+  ma.write_store(merge_log, out)
 
 def drop(args):
   pass
@@ -120,7 +140,8 @@ def normalize(args):
   inp = args.input
   assert(type(inp) == str)
   # fix names, drop duplicates, drop tests with numeric names
-  log = ma.get_logs(inp, args.lh, True, True, True)
+  log = ma.get_logs(inp, args.lh, True, True, True, args.jobs,
+    args.mapped, args.cache)
   assert(lty(log, args.lh))
   log = log[0]
   out = args.output
@@ -131,15 +152,14 @@ def avg(args):
   assert(lins(logs, ma.Log))
   log = avg_hlp(logs, args.lh)
   out = args.output
-  ma.gherkin(log, out)
+  ma.write_store(log, out)
 
-# Compare two logs
+# Compare two logs (given as pairs of filename and counts, see
+# ma.get_log_counts())
 def cmp(args):
   logs = args.input
-  assert(lty(logs, ma.Log))
   assert(len(logs) == 2)
-  log1 = logs[0]
-  log2 = logs[1]
+  (fn1, d1), (fn2, d2) = logs
   a = args.all
   w = args.weaker
   stronger = args.stronger
@@ -150,9 +170,8 @@ def cmp(args):
   c2l = 20
   c3l = 20
 
-  header = ljcut('Test', c1l) + ljcut(log1.fn, c2l) + ljcut(log2.fn, c3l) + '\n'
+  header = ljcut('Test', c1l) + ljcut(fn1, c2l) + ljcut(fn2, c3l) + '\n'
   s = header
-  ks = ma.get_keys(logs)
   
   # Get formatted num
   def get_num(e, f):
@@ -161,9 +180,9 @@ def cmp(args):
     else:
       return '--'
 
-  for k in ks:
-    e1 = log1.get(k)
-    e2 = log2.get(k)
+  for k in sorted(set(d1) | set(d2)):
+    e1 = d1.get(k)
+    e2 = d2.get(k)
     assert(e1 or e2)
     # All
     if a:
@@ -199,25 +218,21 @@ def cmp(args):
 
   print(s)
 
-# Assert a log relation
+# Assert a log relation (logs given as for cmp)
 def assert_relation(args):
 
   logs = args.input
-  assert(lty(logs, ma.Log))
   assert(len(logs) == 2)
-  log1 = logs[0]
-  log2 = logs[1]
+  (_, d1), (_, d2) = logs
   e = args.equal
   woe = args.weaker_or_equal
   soe = args.stronger_or_equal
 
-  ks = ma.get_keys(logs)
-
   fail = False
 
-  for k in ks:
-    e1 = log1.get(k)
-    e2 = log2.get(k)
+  for k in sorted(set(d1) | set(d2)):
+    e1 = d1.get(k)
+    e2 = d2.get(k)
     assert(e1 or e2)
     if (not e1) or (not e2):
       continue
@@ -241,92 +256,113 @@ def assert_relation(args):
 
   print('pass')
 
-# Only keep best results from an incantation log
+# Only keep best results from an incantation log (the entry with the most
+# positive outcomes per test name, see best_policies for ties)
 def best(args):
   log = args.input
   assert(type(log) == ma.LogInc)
-
-  names = log.get_long_names()
-  assert(lty(names, str))
-
-  # Output log
-  ol = ma.Log()
+  better = best_policies[args.tie]
+
+  # Best entry so far per test name, in the order of first appearance
+  d = collections.OrderedDict()
+  for el in log.get_all():
+    b = d.get(el.name)
+    if b == None or better(el, b):
+      d[el.name] = el
+
+  # Output log (the keys of an incantation log record the incantations of the
+  # best entries)
+  if args.keep_incantation:
+    ol = ma.LogInc()
+  else:
+    ol = ma.Log()
   ol.fn = log.fn
+  for el in d.values():
+    ol.d[ol.get_key(el)] = el
+
+  out = args.output
+  ma.write_store(ol, out)
 
-  entries = log.get_all()
-  assert(lty(entries, L))
-  for name in names:
-    es = list(filter(lambda x: x.name == name, entries))
-    assert(lty(entries, L))
-    el = max(es, key=lambda x: x.pos)
-    ol.append(el)
+# Aggregate logs with a reduction over the logs per test (see aggregate.py)
+def reduce(args):
+  logs = args.input
+  assert(lins(logs, ma.Log))
+  chk(len(logs) >= 2, 'need to provide at least two logs')
+  log = ag.reduce_logs(logs, args.lh, args.reduction)
+  out = args.output
+  ma.write_store(log, out)
 
+# Only keep the tests selected by a filter expression
+def select(args):
+  log = args.input
+  assert(isinstance(log, ma.Log))
+  filt = fi.get_filter_chk(args.expr)
+  log = log.select(filt)
   out = args.output
-  ma.gherkin(ol, out)
+  ma.write_store(log, out)
 
 ######################
 # Subcommand helpers #
 ######################
 
-# Produce one sum log from several individual logs
-def sum_hlp(logs, lh):
-  assert(lty(logs, lh))
-  chk(len(logs) >= 2, 'need to provide at least two logs')
-
-  ks = ma.get_keys(logs)
-  sum_log = lh()
-  sum_log.fn = 'sum'
-
-  for k in ks:
-    # Get base log entry for key
-    ler = ma.get_entry(k, logs)
-    sum_le = copy.deepcopy(ler)
-    sum_le.raw = ''
-    sum_le.raw_fixed = ''
-    sum_le.pos = 0
-    sum_le.neg = 0
-    sum_le.total = 0
-    sum_le.parent = 'sum'
+# Number of incantations of an entry
+def count_incantations(le):
+  return bin(le.get_incantations()).count('1')
+
+# Tie-break policies of best: whether entry e is better than the best entry b
+# so far (the entries are gone over in log order)
+best_policies = {
+  # First entry in the log
+  'first': lambda e, b: e.pos > b.pos,
+  # Last entry in the log
+  'last': lambda e, b: e.pos >= b.pos,
+  # Entry with the fewest incantations, then the first
+  'fewest': lambda e, b: e.pos > b.pos or (e.pos == b.pos and
+    count_incantations(e) < count_incantations(b)),
+  # Entry with the most runs, then the first
+  'most-runs': lambda e, b: e.pos > b.pos or (e.pos == b.pos and
+    e.total > b.total)
+}
+
+# Produce sum entries from logs given as entry streams (see
+# ma.get_entry_stream()); only one entry per log is in memory at a time
+# Returns: iterator of (key, sum entry) in key order
+def sum_entries(its):
+  for k, les in ma.merge_entry_streams(its):
+    # Get base log entry for key (from the first log that has it)
+    ler = les[0][1]
+    sum_le = ler.get_aggregate('sum')
     # Do consistency check and sum
-    for log in logs:
-      le = log.get(k)
-      if le:
-        try:
-          ler.check_const(le)
-        except ma.InconsistentTestsError as e:
-          print(e)
-          break
-        sum_le.pos += le.pos
-        sum_le.neg += le.neg
-        assert(le.total == le.pos + le.neg)
-        sum_le.total += le.total
+    for j, le in les:
+      try:
+        ler.check_const(le)
+      except ma.InconsistentTestsError as e:
+        print(e)
+        break
+      sum_le.pos += le.pos
+      sum_le.neg += le.neg
+      assert(le.total == le.pos + le.neg)
+      sum_le.total += le.total
     else:
-      # Add entry to sum log
-      sum_log.append(sum_le)
-
-  return sum_log
+      yield k, sum_le
 
 # Produce one avg log from several individual logs
 def avg_hlp(logs, lh):
   assert(lty(logs, lh))
   chk(len(logs) >= 2, 'need to provide at least two logs')
 
-  ks = ma.get_keys(logs)
+  ls = ma.LogSet(logs)
   avg_log = lh()
   avg_log.fn = 'avg'
 
-  for k in ks:
+  for k in ls.get_keys():
     # Get base log entry for key
-    ler = ma.get_entry(k, logs)
-    avg_le = copy.deepcopy(ler)
-    avg_le.raw = ''
-    avg_le.raw_fixed = ''
-    avg_le.pos = 0
-    avg_le.neg = 0
-    avg_le.parent = 'avg'
+    ler = ls.get_entry(k)
+    avg_le = ler.get_aggregate('avg')
+    # The total is the one of the base entry
+    avg_le.total = ler.total
     # Do consistency check and sum
-    for log in logs:
-      le = log.get(k)
+    for le in ls.get_entries(k):
       if le:
         try:
           ler.check_const(le)
@@ -334,6 +370,7 @@ def avg_hlp(logs, lh):
           print(e)
           break
         total = le.pos + le.neg
+        chk(total != 0, 'test without outcomes: ' + k)
         avg_le.pos += le.pos / total
         avg_le.neg += le.neg / total
     else:
@@ -356,11 +393,11 @@ class InputAction(argparse.Action):
   def __call__(self, parser, namespace, values, option_string=None):
     setattr(namespace, self.dest, values)
 
-def many_to_one(p, h1='log (pickle)', h2='log (text or pickle)'):
+def many_to_one(p, h1='log (store)', h2='log (text or binary)'):
   p.add_argument('output', help=h1)
   p.add_argument('input', nargs='+', action=InputAction, help=h2)
 
-def one_to_one(p, h1='log (pickle)', h2='log (text or pickle)'):
+def one_to_one(p, h1='log (store)', h2='log (text or binary)'):
   p.add_argument('output', help=h1)
   p.add_argument('input', action=InputAction, help=h2)
 
@@ -371,13 +408,14 @@ def get_cmdline_parser(cmds):
   parent = argparse.ArgumentParser(add_help=False)
   parent.add_argument('-i', '--incantations', action='store_true',
     help='input and output logs are incantation logs')
+  ma.add_input_options(parent)
 
   sp = p.add_subparsers(help='use <subcommand> -h for further help', title=
     'subcommands')
 
   # dump: dump internal log representation
   p1 = sp.add_parser(cmds[0], parents=[parent], description='Dump the log')
-  p1.add_argument('input', action=InputAction, help='log (text or pickle)')
+  p1.add_argument('input', action=InputAction, help='log (text or binary)')
   group = p1.add_mutually_exclusive_group(required=True)
   group.add_argument('-r', '--raw', action='store_true',
     help='dump raw source log')
@@ -385,6 +423,8 @@ def get_cmdline_parser(cmds):
     help='dump fixed raw source log')
   group.add_argument('-n', '--internal', action='store_true',
     help='dump internal representation of log')
+  group.add_argument('-k', '--keys', action='store_true',
+    help='dump keys of log (log stores are read without their entries)')
   p1.set_defaults(func=partial(mux, dump))
 
   # parse: format check
@@ -393,14 +433,15 @@ def get_cmdline_parser(cmds):
  Useful for checking whether the format of the log produced by e.g. litmus is\
  understood by this script.')
   p2.add_argument('input', action=InputAction,
-    help='log (text or pickle)')
+    help='log (text or binary)')
   p2.set_defaults(func=partial(mux, parse))
 
-  # pickle: parse and pickle
-  p3 = sp.add_parser(cmds[2], parents=[parent],
-    description='Pickle the given log')
+  # store: parse and write log store (formerly pickle)
+  p3 = sp.add_parser(cmds[2], parents=[parent], aliases=['pickle'],
+    description='Write the given log to a log store (pickle is an alias of\
+ this subcommand)')
   one_to_one(p3)
-  p3.set_defaults(func=partial(mux, pickle))
+  p3.set_defaults(func=partial(mux, store))
 
   # sort: sort log according to dict key
   p4 = sp.add_parser(cmds[3], parents=[parent],
@@ -411,7 +452,7 @@ def get_cmdline_parser(cmds):
 
   # sum: sum logs
   p5 = sp.add_parser(cmds[4], parents=[parent])
-  many_to_one(p5, h1='sum log (pickle)')
+  many_to_one(p5, h1='sum log (store)')
   p5.set_defaults(func=partial(mux, sum))
 
   # fix: -
@@ -452,7 +493,7 @@ taken from the internal name of the first log. (deprecated)"""
   p11 = sp.add_parser(cmds[10], parents=[parent],
     description='Compare two logs (e.g. a litmus and a herd log)')
   p11.add_argument('input', nargs=2, action=InputAction,
-    help='log (text or pickle)')
+    help='log (text or binary)')
   group = p11.add_mutually_exclusive_group(required=True)
   group.add_argument('-a', '--all', action='store_true',
     help='print all tests')
@@ -470,7 +511,7 @@ taken from the internal name of the first log. (deprecated)"""
   p12 = sp.add_parser(cmds[11], parents=[parent],
     description='Assert log relation (e.g. between a litmus and a herd log)')
   p12.add_argument('input', nargs=2, action=InputAction,
-    help='log (text or pickle)')
+    help='log (text or binary)')
   group = p12.add_mutually_exclusive_group(required=True)
   group.add_argument('-e', '--equal', action='store_true',
     help='assert equality (for all tests that exist in both logs)')
@@ -485,10 +526,35 @@ taken from the internal name of the first log. (deprecated)"""
   # best: only keep best results from an incantation log
   p13 = sp.add_parser(cmds[12], parents=[parent],
     description='Keep best results from an incantation log')
-  p13.add_argument('output', help='log (pickle)')
-  p13.add_argument('input', help='incantation log (text or pickle)')
+  p13.add_argument('-t', '--tie', choices=list(best_policies), default='first',
+    help='entry to keep of several with the most positive outcomes: the first\
+ or last in the log, the one with the fewest incantations, or the one with the\
+ most runs (default: first)')
+  p13.add_argument('-k', '--keep-incantation', action='store_true',
+    help='write an incantation log, whose keys record the incantations of the\
+ best entries')
+  p13.add_argument('output', help='log (store)')
+  p13.add_argument('input', help='incantation log (text or binary)')
   p13.set_defaults(func=partial(mux, best))
 
+  # select: only keep tests selected by a filter expression
+  p14 = sp.add_parser(cmds[13], parents=[parent],
+    description="Keep the tests selected by a filter expression, e.g.\
+ \"scope=warp & mem=global & name~'MP'\" (see filters.py)")
+  p14.add_argument('expr', help='filter expression')
+  one_to_one(p14)
+  p14.set_defaults(func=partial(mux, select))
+
+  # reduce: aggregate logs with a reduction (cf. sum)
+  p15 = sp.add_parser(cmds[14], parents=[parent],
+    description='Aggregate logs with a reduction over the logs per test (sum:\
+ sum of the counts; max/min: counts of the log with the most/fewest positive\
+ outcomes); needs numpy')
+  p15.add_argument('-r', '--reduction', choices=sorted(ag.reductions),
+    default='sum', help='reduction (default: sum)')
+  many_to_one(p15)
+  p15.set_defaults(func=partial(mux, reduce))
+
   return p
 
 if __name__ == "__main__":
@@ -496,10 +562,10 @@ if __name__ == "__main__":
     sys.argv += ['-h']
   cmd = sys.argv[1]
   ma.setup_err_handling('log2log.py')
-  cmds = ['dump', 'parse', 'pickle', 'sort', 'sum', 'fix', 'merge', 'drop',
-    'normalize', 'avg', 'cmp', 'assert', 'best']
+  cmds = ['dump', 'parse', 'store', 'sort', 'sum', 'fix', 'merge', 'drop',
+    'normalize', 'avg', 'cmp', 'assert', 'best', 'select', 'reduce']
   p = get_cmdline_parser(cmds)
-  if cmd not in cmds:
+  if cmd not in cmds + ['pickle']:
     p.print_help()
     sys.exit(2)
   print('cmd: ' + cmd)
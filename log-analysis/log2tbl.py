@@ -7,6 +7,8 @@ import collections
 import textwrap
 from functools import partial
 import machinery as ma
+import columns as co
+import filters as fi
 from machinery import ErrMsg, chk, bail
 from machinery import LogEntry as L
 from generic import lty, interleave, itemify, dupchk, listify, w_str
@@ -114,10 +116,11 @@ class HtmlFile:
 
 ### Used by all HTML file producers
 # ks: list of test names to include in the table
-# logs: list of log objects (only logs which have the key are included in the
-#       table)
+# logs: list of log objects or LogSet (only logs which have any of the keys are
+#       included in the table)
 def produce_table(ks, logs, diro='entries'):
-  logs = [ l for l in logs if l.any_key(ks) ]  
+  ls = ma.get_log_set(logs)
+  logs = ls.get_logs_with_keys(ks)
   s = '<table>\n'
 
   # Process header
@@ -138,7 +141,7 @@ def produce_table(ks, logs, diro='entries'):
   for k in ks:
     # Start new row
     s += '<tr>\n'
-    le = ma.get_entry(k, logs)
+    le = ls.get_entry(k)
     s += le.pp_prefix(2)
     for log in logs:
       e = log.get(k)
@@ -156,26 +159,25 @@ def produce_table(ks, logs, diro='entries'):
 # Filtering according to scopes and memory regions; no filtering according to
 # names
 def get_section_filters():
-  def c(f, g):
-    return lambda e: f(e) and g(e)
-  # List of functions that each take a log entry
-  d = [
+  # Filter expressions (see filters.py); the compiled filters take a log entry
+  # or a columnar view (see columns.py)
+  l = [
     # Simple scopes, global memory
-    c(L.is_warp, L.is_global),
-    c(L.is_cta, L.is_global),
-    c(L.is_ker, L.is_global),
+    'scope=warp & mem=global',
+    'scope=cta & mem=global',
+    'scope=ker & mem=global',
     # Simple scopes, shared memory
-    c(L.is_warp, L.is_shared),
+    'scope=warp & mem=shared',
     # Simple scopes, mixed memory
-    c(L.is_warp, L.is_mixed_mem),
+    'scope=warp & mem=mixed',
     # Mixed scopes, global memory
-    c(L.is_mixed_scope, L.is_global),
+    'scope=mixed & mem=global',
     # Mixed scopes, shared memory
-    c(L.is_mixed_scope, L.is_shared),
+    'scope=mixed & mem=shared',
     # Mixed scopes, mixed memory
-    c(L.is_mixed_scope, L.is_mixed_mem)
+    'scope=mixed & mem=mixed'
   ]
-  return d
+  return [fi.get_filter(s) for s in l]
 
 def get_section_names():
   # Parallel the above functions
@@ -202,6 +204,33 @@ def get_axiom_patterns():
   ]
   return l
 
+# Incantations of a column of the incantation tables (see
+# LogEntry.get_incantations()); the bits of i select (from the most
+# significant) mem_stress, general_bc, barrier, and rand_threads
+def get_incantation_bits(i):
+  incs = [L.mem_stress_bit, L.general_bc_bit, L.barrier_bit, L.rand_threads_bit]
+  bits = 0
+  for j, inc in enumerate(incs):
+    if i & (0b1000 >> j):
+      bits |= inc
+  return bits
+
+# Scope and memory of the sections of the incantation tables (see
+# LogInc.lookup()), including table description and filename suffix
+def get_incantation_sections():
+  l = [
+    (ma.Scope.warp, L.mem_global_bit,
+     'All threads in different warps, global memory',
+     's1-global'),
+    (ma.Scope.warp, L.mem_shared_bit,
+     'All threads in different warps, shared memory',
+     's1-shared'),
+    (ma.Scope.cta, L.mem_global_bit,
+     'All threads in different CTAs, global memory',
+     's2-global')
+  ]
+  return l
+
 # ------------------------------------------------------------------------------
 
 ############
@@ -222,7 +251,14 @@ def mux(f, args):
     c = type(inp) is list
     if not c:
       inp = [inp]
-    inp = ma.get_logs(inp, lh=ma.Log)
+    inp = ma.get_logs(inp, lh=ma.Log, jobs=args.jobs,
+      mapped=args.mapped, cache=args.cache)
+    # Only keep the tests selected by the filter expression (on the entry of
+    # the first log that has a test, such that all logs keep the same tests)
+    if args.filter:
+      filt = fi.get_filter_chk(args.filter)
+      ks = set(ma.get_filtered_keys(filt, ma.LogSet(inp)))
+      inp = [log.restrict(ks) for log in inp]
     if not c:
       inp = inp[0]
     args.input = inp
@@ -241,32 +277,35 @@ def classified(args):
   assert(hasattr(args, 'diro'))
 
   l = get_axiom_patterns()
+  ls = ma.LogSet(logs)
+  v = co.get_view(ls)
 
   h = HtmlFile()
   all_matching = []
  
-  for name, val in l:
-    ks = ma.get_matching_keys(val, logs)
+  # Keys of all axioms from one pass over the keys
+  kss = v.get_classified_keys([val for name, val in l])
+  for (name, val), ks in zip(l, kss):
     if pos:
-      ks = ma.get_pos_keys(logs, ks)
+      ks = v.get_pos_keys(ks)
     all_matching += ks
     if ks:
       h.new_section(name, 0)
-      s = produce_table(ks, logs, diro=args.diro)
+      s = produce_table(ks, ls, diro=args.diro)
       h.add_html(s)
 
   all_matching = set(all_matching)
   if pos:
-    ks = ma.get_pos_keys(logs)
+    ks = v.get_pos_keys()
   else:
-    ks = ma.get_keys(logs)
+    ks = v.get_keys()
   ks = set(ks) - all_matching
   ks = list(ks)
 
   if ks:
     h.new_section('Other', 0)
     ks.sort()
-    s = produce_table(ks, logs)
+    s = produce_table(ks, ls)
     h.add_html(s)
 
   h.finish()
@@ -280,14 +319,16 @@ def two_level(args):
   assert(hasattr(args, 'diro'))
 
   l = get_axiom_patterns()
+  ls = ma.LogSet(logs)
+  v = co.get_view(ls)
 
   h = HtmlFile()
   all_matching = []
 
-  for name, val in l:
-    ks_s = ma.get_matching_keys(val, logs)
+  kss = v.get_classified_keys([val for name, val in l])
+  for (name, val), ks_s in zip(l, kss):
     if pos:
-      ks_s = ma.get_pos_keys(logs, ks_s)
+      ks_s = v.get_pos_keys(ks_s)
     all_matching += ks_s
     if ks_s:
       h.new_section(name, 0)
@@ -295,20 +336,20 @@ def two_level(args):
       filters = get_section_filters()
       names = get_section_names()
       for f, name in zip(filters, names):
-        ks = ma.get_filtered_keys(f, logs, ks_s)
+        ks = v.get_filtered_keys(f, ks_s)
         if pos:
-          ks = ma.get_pos_keys(logs, ks)
+          ks = v.get_pos_keys(ks)
         if ks:
           h.new_section(name, 1)
-          s = produce_table(ks, logs, diro=args.diro)
+          s = produce_table(ks, ls, diro=args.diro)
           h.add_html(s)
 
   # Rest
   all_matching = set(all_matching)
   if pos:
-    ks_s = ma.get_pos_keys(logs)
+    ks_s = v.get_pos_keys()
   else:
-    ks_s = ma.get_keys(logs)
+    ks_s = v.get_keys()
   ks_s = set(ks_s) - all_matching
   ks_s = list(ks_s)
 
@@ -319,12 +360,12 @@ def two_level(args):
     filters = get_section_filters()
     names = get_section_names()
     for f, name in zip(filters, names):
-      ks = ma.get_filtered_keys(f, logs, ks_s)
+      ks = v.get_filtered_keys(f, ks_s)
       if pos:
-        ks = ma.get_pos_keys(logs, ks)
+        ks = v.get_pos_keys(ks)
       if ks:
         h.new_section(name, 1)
-        s = produce_table(ks, logs, diro=args.diro)
+        s = produce_table(ks, ls, diro=args.diro)
         h.add_html(s)
 
   h.finish()
@@ -339,16 +380,18 @@ def sections(args):
 
   s = ''
   h = HtmlFile()
+  ls = ma.LogSet(logs)
+  v = co.get_view(ls)
 
   filters = get_section_filters()
   names = get_section_names()
   for f, name in zip(filters, names):
-    ks = ma.get_filtered_keys(f, logs)
+    ks = v.get_filtered_keys(f)
     if pos:
-      ks = ma.get_pos_keys(logs, ks)
+      ks = v.get_pos_keys(ks)
     if ks:
       h.new_section(name, 0)
-      s = produce_table(ks, logs, diro=args.diro)
+      s = produce_table(ks, ls, diro=args.diro)
       h.add_html(s)
 
   h.finish()
@@ -362,11 +405,12 @@ def flat(args):
   assert(hasattr(args, 'diro'))
 
   # Get all the keys
+  ls = ma.LogSet(logs)
   if pos:
-    ks = ma.get_pos_keys(logs)
+    ks = co.get_view(ls).get_pos_keys()
   else:
-    ks = ma.get_keys(logs)
-  s = produce_table(ks, logs, diro=args.diro)
+    ks = ls.get_keys()
+  s = produce_table(ks, ls, diro=args.diro)
 
   h = HtmlFile()
   h.add_html(s)
@@ -423,32 +467,31 @@ def latex(args):
   pos = args.pos
   logs = args.input
   assert(type(logs) == ma.Log)
+  ls = ma.LogSet(logs)
   
   n = 4
 
   l = ['CO', 'Co', 'LB[^+]', 'MP[^+]', 'WRC[^+]', 'ISA2[^+]', '2\+2W[^+]',
        'W\+RW\+2W[^+]', 'S[^+]+$', 'SB[^+]', 'R[^+]+$', 'RWC[^+]', 'IRIW[^+]']
 
+  lc = fi.name_expr(['CoWW', 'COWW'])
+  l = fi.name_expr(l)
+
   # Produce d-warp:s-cta table, global memory
-  f = lambda e: L.is_global(e) and \
-                ((L.is_warp(e) and L.does_match(e, l)) or
-                 (L.does_match(e, ['CoWW', 'COWW'])))
-  s = latex_tbl(f, logs, n)
+  f = fi.get_filter('mem=global & (scope=warp & ' + l + ' | ' + lc + ')')
+  s = latex_tbl(f, ls, n)
 
   s += '\n'
   
   # Produce d-warp:s-cta table, shared memory
-  f = lambda e: L.is_shared(e) and \
-                ((L.is_warp(e) and L.does_match(e, l)) or
-                 (L.does_match(e, ['CoWW', 'COWW'])))
-  s += latex_tbl(f, logs, n)
+  f = fi.get_filter('mem=shared & (scope=warp & ' + l + ' | ' + lc + ')')
+  s += latex_tbl(f, ls, n)
 
   s += '\n'
 
   # Produce d-cta:s-ker table, global memory
-  f = lambda e: L.is_global(e) and \
-                ((L.is_cta(e) and L.does_match(e, l))) 
-  s += latex_tbl(f, logs, n)
+  f = fi.get_filter('mem=global & scope=cta & ' + l)
+  s += latex_tbl(f, ls, n)
 
   w_str(args.out, s)
 
@@ -456,40 +499,41 @@ def latex2(args):
   pos = args.pos
   logs = args.input
   assert(type(logs) == ma.Log)
+  ls = ma.LogSet(logs)
 
   sep = ' & '
   l = ['CO', 'Co', 'LB[^+]', 'MP[^+]', 'WRC[^+]', 'ISA2[^+]', '2\+2W[^+]',
        'W\+RW\+2W[^+]', 'S[^+]+$', 'SB[^+]', 'R[^+]+$', 'RWC[^+]', 'IRIW[^+]']
-  lc = ['CoWW', 'COWW']
+  lc = fi.name_expr(['CoWW', 'COWW'])
 
-  ks = ma.get_matching_keys(l, logs)
+  ks = ma.get_matching_keys(l, ls)
   
   # Names + s1 + global memory
-  f = lambda e: L.is_global(e) and (L.is_warp(e) or L.does_match(e, lc))
-  ks1 = ma.get_filtered_keys(f, logs, ks)
+  f = fi.get_filter('mem=global & (scope=warp | ' + lc + ')')
+  ks1 = ma.get_filtered_keys(f, ls, ks)
   ks1.sort()
   n = len(ks1)
   l = list()
   for i, k in enumerate(ks1):
-    e = ma.get_entry(k, logs)
+    e = ma.get_entry(k, ls)
     l.append(e.short_name.lower() + sep + str(e.pos) + sep)
 
   # s1 + shared memory
-  f = lambda e: L.is_shared(e) and (L.is_warp(e) or L.does_match(e, lc))
-  ks2 = ma.get_filtered_keys(f, logs, ks)
+  f = fi.get_filter('mem=shared & (scope=warp | ' + lc + ')')
+  ks2 = ma.get_filtered_keys(f, ls, ks)
   ks2.sort()
   assert(len(ks2) == n)
   for i, k in enumerate(ks2):
-    e = ma.get_entry(k, logs)
+    e = ma.get_entry(k, ls)
     l[i] += str(e.pos) + sep
 
   # s2 + global memory  
-  f = lambda e: L.is_global(e) and (L.is_cta(e) or L.does_match(e, lc))
-  ks3 = ma.get_filtered_keys(f, logs, ks)
+  f = fi.get_filter('mem=global & (scope=cta | ' + lc + ')')
+  ks3 = ma.get_filtered_keys(f, ls, ks)
   ks3.sort()
   assert(len(ks3) == n)
   for i, k in enumerate(ks3):
-    e = ma.get_entry(k, logs)
+    e = ma.get_entry(k, ls)
     l[i] += str(e.pos) + '\\\\'
 
   s = '\n'.join(l)
@@ -500,32 +544,31 @@ def latex3(args):
   pos = args.pos
   logs = args.input
   assert(type(logs) == ma.Log)
+  ls = ma.LogSet(logs)
   
   n = 8
 
   l = ['CO', 'Co', 'LB[^+]', 'MP[^+]', 'WRC[^+]', 'ISA2[^+]', '2\+2W[^+]',
        'W\+RW\+2W[^+]', 'S[^+]+$', 'SB[^+]', 'R[^+]+$', 'RWC[^+]', 'IRIW[^+]']
 
+  lc = fi.name_expr(['CoWW', 'COWW'])
+  l = fi.name_expr(l)
+
   # Produce d-warp:s-cta table, global memory
-  f = lambda e: L.is_global(e) and \
-                ((L.is_warp(e) and L.does_match(e, l)) or
-                 (L.does_match(e, ['CoWW', 'COWW'])))
-  s = latex_tbl2(f, logs, n)
+  f = fi.get_filter('mem=global & (scope=warp & ' + l + ' | ' + lc + ')')
+  s = latex_tbl2(f, ls, n)
 
   s += '\n'
   
   # Produce d-warp:s-cta table, shared memory
-  f = lambda e: L.is_shared(e) and \
-                ((L.is_warp(e) and L.does_match(e, l)) or
-                 (L.does_match(e, ['CoWW', 'COWW'])))
-  s += latex_tbl2(f, logs, n)
+  f = fi.get_filter('mem=shared & (scope=warp & ' + l + ' | ' + lc + ')')
+  s += latex_tbl2(f, ls, n)
 
   s += '\n'
 
   # Produce d-cta:s-ker table, global memory
-  f = lambda e: L.is_global(e) and \
-                ((L.is_cta(e) and L.does_match(e, l))) 
-  s += latex_tbl2(f, logs, n)
+  f = fi.get_filter('mem=global & scope=cta & ' + l)
+  s += latex_tbl2(f, ls, n)
 
   w_str(args.out, s)
 
@@ -551,7 +594,8 @@ def incantations(args):
   assert(type(chip) == str)
 
   # Get incantation log
-  log = ma.get_logs(log, lh=ma.LogInc)
+  log = ma.get_logs(log, lh=ma.LogInc, jobs=args.jobs,
+    mapped=args.mapped, cache=args.cache)
   assert(lty(log, ma.LogInc))
   assert(len(log) == 1)
   log = log[0]
@@ -559,9 +603,6 @@ def incantations(args):
   out_base = args.out
   assert(out_base)
 
-  les = log.get_all()
-  assert(lty(les, L))
-
   # Table header
   prefix = textwrap.dedent(r"""
   \definecolor{Gray}{gray}{0.85}
@@ -580,24 +621,11 @@ def incantations(args):
   \hline
   """)
 
-  # Scope and mem filters, including table description and filename suffix
-  sfs = [
-    (lambda e: L.is_warp(e) and L.is_global(e),
-     'All threads in different warps, global memory',
-     's1-global'),
-    (lambda e: L.is_warp(e) and L.is_shared(e),
-     'All threads in different warps, shared memory',
-     's1-shared'),
-    (lambda e: L.is_cta(e) and L.is_global(e),
-     'All threads in different CTAs, global memory',
-     's2-global')
-  ]
+  # Scope and mem of the sections, including table description and filename
+  # suffix
+  sfs = get_incantation_sections()
 
-  # Column filters
-  fs1 = [lambda e: not L.is_mem_stress(e), lambda e: L.is_mem_stress(e)]
-  fs2 = [lambda e: not L.is_general_bc(e), lambda e: L.is_general_bc(e)]
-  fs3 = [lambda e: not L.is_barrier(e), lambda e: L.is_barrier(e)]
-  fs4 = [lambda e: not L.is_rand_threads(e), lambda e: L.is_rand_threads(e)]
+  # Number of columns (see get_incantation_bits())
   nc = 16
 
   # Line filters
@@ -610,35 +638,22 @@ def incantations(args):
   ]
   lfs = collections.OrderedDict(lfs)
 
-  for sf, cfg, suf in sfs:
+  for scope, mem, cfg, suf in sfs:
     s = prefix
     s = s.replace('<config>', cfg, 1)
     s = s.replace('<chip>', chip, 1)
-    l1 = list(filter(sf, les))
-    assert(lty(l1, L))
     for sec, tests in lfs.items():
       tests.sort()
       # Section header
       s += r'{\bf ' + sec + '}' + (' &' * nc) + r'\\' + '\n'
       for t in tests:
-        # Get all tests that match a simple test name (like rwc)
-        l2 = list(filter(partial(L.simple_match, s=t), l1))
-        assert(lty(l2, L))
-        if (len(l2) == 0):
+        # Skip tests (simple test names like rwc) not in the section
+        if not log.lookup(t, scope, mem):
           continue
         s += t
         for i in range(0, nc):
-          i1 = (i & 0b1000) >> 3
-          i2 = (i & 0b0100) >> 2
-          i3 = (i & 0b0010) >> 1
-          i4 = (i & 0b0001)
-          f1 = fs1[i1]
-          f2 = fs2[i2]
-          f3 = fs3[i3]
-          f4 = fs4[i4]
-          f = lambda e: f1(e) and f2(e) and f3(e) and f4(e)
           entry = '-'
-          item = list(filter(f, l2))
+          item = log.lookup(t, scope, mem, get_incantation_bits(i))
           if item:
             item = itemify(item)
             assert(type(item) == L)
@@ -670,7 +685,8 @@ def incantations_flat(args):
     chip_old = chip  
   assert(type(chip) == str)
 
-  log = ma.get_logs(log, lh=ma.LogInc)
+  log = ma.get_logs(log, lh=ma.LogInc, jobs=args.jobs,
+    mapped=args.mapped, cache=args.cache)
   assert(lty(log, ma.LogInc))
   assert(len(log) == 1)
   log = log[0]
@@ -679,9 +695,6 @@ def incantations_flat(args):
   out_base = args.out
   assert(out_base)
 
-  les = log.get_all()
-  assert(lty(les, L))
-
   short_names = log.get_names()
   assert(lty(short_names, str))
   short_names.sort()
@@ -704,53 +717,27 @@ def incantations_flat(args):
   \hline
   """)
 
-  # Scope and mem filters, including table description and filename suffix
-  sfs = [
-    (lambda e: L.is_warp(e) and L.is_global(e),
-     'All threads in different warps, global memory',
-     's1-global'),
-    (lambda e: L.is_warp(e) and L.is_shared(e),
-     'All threads in different warps, shared memory',
-     's1-shared'),
-    (lambda e: L.is_cta(e) and L.is_global(e),
-     'All threads in different CTAs, global memory',
-     's2-global')
-  ]
+  # Scope and mem of the sections, including table description and filename
+  # suffix
+  sfs = get_incantation_sections()
 
-  # Column filter building blocks (need to be combined to yield a single column
-  # filter)
-  fs1 = [lambda e: not L.is_mem_stress(e), lambda e: L.is_mem_stress(e)]
-  fs2 = [lambda e: not L.is_general_bc(e), lambda e: L.is_general_bc(e)]
-  fs3 = [lambda e: not L.is_barrier(e), lambda e: L.is_barrier(e)]
-  fs4 = [lambda e: not L.is_rand_threads(e), lambda e: L.is_rand_threads(e)]
+  # Number of columns (see get_incantation_bits())
   nc = 16
 
-  # Scope and mem filters, table description, filename suffix
-  for sf, cfg, suf in sfs:
+  # Scope and mem, table description, filename suffix
+  for scope, mem, cfg, suf in sfs:
     s = prefix
     s = s.replace('<config>', cfg, 1)
     s = s.replace('<chip>', chip, 1)
-    l1 = list(filter(sf, les))
-    assert(lty(l1, L))
     for t in short_names:
-      l2 = list(filter(partial(L.simple_match, s=t), l1))
-      assert(lty(l2, L))
-      if (len(l2) == 0):
+      # Skip tests (simple test names like rwc) not in the section
+      if not log.lookup(t, scope, mem):
         continue
       # Name of test
       s += t
       for i in range(0, nc):
-        i1 = (i & 0b1000) >> 3
-        i2 = (i & 0b0100) >> 2
-        i3 = (i & 0b0010) >> 1
-        i4 = (i & 0b0001)
-        f1 = fs1[i1]
-        f2 = fs2[i2]
-        f3 = fs3[i3]
-        f4 = fs4[i4]
-        f = lambda e: f1(e) and f2(e) and f3(e) and f4(e)
         entry = '-'
-        item = list(filter(f, l2))
+        item = log.lookup(t, scope, mem, get_incantation_bits(i))
         if item:
           item = itemify(item)
           assert(type(item) == L)
@@ -782,7 +769,8 @@ def incantations_html_flat(args):
     chip_old = chip  
   assert(type(chip) == str)
 
-  log = ma.get_logs(log, lh=ma.LogInc)
+  log = ma.get_logs(log, lh=ma.LogInc, jobs=args.jobs,
+    mapped=args.mapped, cache=args.cache)
   assert(lty(log, ma.LogInc))
   assert(len(log) == 1)
   log = log[0]
@@ -791,9 +779,6 @@ def incantations_html_flat(args):
   out_base = args.out
   assert(out_base)
 
-  les = log.get_all()
-  assert(lty(les, L))
-
   short_names = log.get_names()
   assert(lty(short_names, str))
   short_names.sort()
@@ -921,54 +906,28 @@ def incantations_html_flat(args):
   </tr>
   """)
 
-  # Scope and mem filters, including table description and filename suffix
-  sfs = [
-    (lambda e: L.is_warp(e) and L.is_global(e),
-     'All threads in different warps, global memory',
-     's1-global'),
-    (lambda e: L.is_warp(e) and L.is_shared(e),
-     'All threads in different warps, shared memory',
-     's1-shared'),
-    (lambda e: L.is_cta(e) and L.is_global(e),
-     'All threads in different CTAs, global memory',
-     's2-global')
-  ]
+  # Scope and mem of the sections, including table description and filename
+  # suffix
+  sfs = get_incantation_sections()
 
-  # Column filter building blocks (need to be combined to yield a single column
-  # filter)
-  fs1 = [lambda e: not L.is_mem_stress(e), lambda e: L.is_mem_stress(e)]
-  fs2 = [lambda e: not L.is_general_bc(e), lambda e: L.is_general_bc(e)]
-  fs3 = [lambda e: not L.is_barrier(e), lambda e: L.is_barrier(e)]
-  fs4 = [lambda e: not L.is_rand_threads(e), lambda e: L.is_rand_threads(e)]
+  # Number of columns (see get_incantation_bits())
   nc = 16
 
-  # Scope and mem filters, table description, filename suffix
-  for sf, cfg, suf in sfs:
+  # Scope and mem, table description, filename suffix
+  for scope, mem, cfg, suf in sfs:
     s = prefix
     s = s.replace('<config>', cfg, 1)
     s = s.replace('<chip>', chip, 1)
-    l1 = list(filter(sf, les))
-    assert(lty(l1, L))
     for t in short_names:
-      l2 = list(filter(partial(L.simple_match, s=t), l1))
-      assert(lty(l2, L))
-      if (len(l2) == 0):
+      # Skip tests (simple test names like rwc) not in the section
+      if not log.lookup(t, scope, mem):
         continue
       # Name of test
       s += '<tr>\n'
       s += '<td>' + t + '</td>'
       for i in range(0, nc):
-        i1 = (i & 0b1000) >> 3
-        i2 = (i & 0b0100) >> 2
-        i3 = (i & 0b0010) >> 1
-        i4 = (i & 0b0001)
-        f1 = fs1[i1]
-        f2 = fs2[i2]
-        f3 = fs3[i3]
-        f4 = fs4[i4]
-        f = lambda e: f1(e) and f2(e) and f3(e) and f4(e)
         entry = '-'
-        item = list(filter(f, l2))
+        item = log.lookup(t, scope, mem, get_incantation_bits(i))
         if item:
           item = itemify(item)
           assert(type(item) == L)
@@ -1008,9 +967,14 @@ def get_cmdline_parser(cmds):
   # Parent of all
   p = argparse.ArgumentParser()
   
-  # Dummy parent for common options
-  parent = argparse.ArgumentParser(add_help=False)
+  # Dummy parents for common options
+  parent_input = argparse.ArgumentParser(add_help=False)
+  ma.add_input_options(parent_input)
+  parent = argparse.ArgumentParser(add_help=False, parents=[parent_input])
   parent.add_argument('-p', '--pos', action='store_true')
+  parent.add_argument('-f', '--filter', action='store', default=None,
+    help="only include tests selected by a filter expression, e.g.\
+ \"scope=warp & mem=global & name~'MP'\" (see filters.py)")
 
   # Subparsers
   sp = p.add_subparsers(help='use <subcommand> -h for further help', title=
@@ -1070,27 +1034,30 @@ def get_cmdline_parser(cmds):
   p7.set_defaults(func=partial(mux, latex3))
 
   # Incantations
-  p8 = sp.add_parser(cmds[7], description='Produce tables comparing the\
-    effectiveness of the incantations')
-  p8.add_argument('input', action=InputAction, help='log (text or pickle)')
+  p8 = sp.add_parser(cmds[7], parents=[parent_input],
+    description='Produce tables comparing the effectiveness of the\
+    incantations')
+  p8.add_argument('input', action=InputAction, help='log (text or binary)')
   f = cmds[7]
   p8.add_argument('-o', '--out', action='store', default=f,
     help='output file basename (instead of default name)')
   p8.set_defaults(func=partial(mux, incantations))
 
   # Incantations flat
-  p9 = sp.add_parser(cmds[8], description='Produce flat tables comparing the\
-    effectiveness of the incantations')
-  p9.add_argument('input', action=InputAction, help='log (text or pickle)')
+  p9 = sp.add_parser(cmds[8], parents=[parent_input],
+    description='Produce flat tables comparing the effectiveness of the\
+    incantations')
+  p9.add_argument('input', action=InputAction, help='log (text or binary)')
   f = cmds[8]
   p9.add_argument('-o', '--out', action='store', default=f,
     help='output file basename (instead of default name)')
   p9.set_defaults(func=partial(mux, incantations_flat))
 
   # Incantations html
-  p10 = sp.add_parser(cmds[9], description='Produce flat html tables comparing\
-    the effectiveness of the incantations')
-  p10.add_argument('input', action=InputAction, help='log (text or pickle)')
+  p10 = sp.add_parser(cmds[9], parents=[parent_input],
+    description='Produce flat html tables comparing the effectiveness of the\
+    incantations')
+  p10.add_argument('input', action=InputAction, help='log (text or binary)')
   f = cmds[9]
   p10.add_argument('-o', '--out', action='store', default=f,
     help='output file basename (instead of default name)')
@@ -1,16 +1,27 @@
 import argparse
 import re
+import io
 import sys
 import os
 import inspect
 import enum
 import pickle
+import multiprocessing
+import mmap
+import struct
+import hashlib
+import tempfile
+import shutil
+import heapq
+import itertools
+import gzip
+import bz2
+import lzma
 import collections
-import pyparsing as pp
 import traceback
-from functools import reduce
+from functools import partial
 
-from generic import convert, lty, interleave, listify
+from generic import convert, lty, lins, interleave, listify, w_str
 
 # ------------------------------------------------------------------------------
 # Error handling
@@ -67,34 +78,320 @@ def bail(msg):
 
 ### Get input
 # Takes: 
-# - list of filenames (litmus logs or pickles), may be singleton list if only
-#   one input file is requested;
-# - the optional arguments only have an effect when a textual litmus log is
-#   given
-# Returns: list of Log objects
-def get_logs(fs, lh, fix_names=False, drop_dups=False, drop_numeric=False):
+# - list of filenames (litmus logs, log stores, or pickles), may be singleton
+#   list if only one input file is requested;
+# - the optional arguments fix_names, drop_dups, and drop_numeric only have an
+#   effect when a textual litmus log is given
+# - jobs: number of processes to use for loading the files (or for parsing
+#   the entries if a single textual log is given)
+# - mapped: memory-map textual logs instead of keeping the raw text of the
+#   entries in memory (see Log.from_file())
+# - cache: directory of the parse cache for textual logs (see get_cache_fn()),
+#   or None
+# Returns: list of Log objects (in the order of the filenames)
+def get_logs(fs, lh, fix_names=False, drop_dups=False, drop_numeric=False,
+  jobs=1, mapped=False, cache=None):
   fs = listify(fs)
   assert(len(fs) > 0)
-  l = list()
-  for f in fs:
-    try:
-      log = unpickle(f)
-      log.verify()
-      chk(type(log) == lh, 'wrong log type (maybe use -i)')
-      print('unpickled file ' + f)
-    except OSError:
-      raise
-    except Exception:
-      # Cannot unpickle file as it may be a textual log
-      log = lh()
-      print('opening file ' + f + ' as textual litmus log')
-      log.from_file(f, fix_names, drop_dups, drop_numeric)
-      log.verify()
-    l.append(log) 
+  assert(jobs >= 1)
+  if len(fs) == 1:
+    # Use the processes for parsing the entries of the log
+    return [get_log(fs[0], lh, fix_names, drop_dups, drop_numeric, jobs,
+      mapped, cache)]
+  al = [(f, lh, fix_names, drop_dups, drop_numeric, 1, mapped, cache)
+    for f in fs]
+  if jobs == 1:
+    return [get_log(*a) for a in al]
+  p = multiprocessing.Pool(min(jobs, len(fs)))
+  l = p.map(get_log_worker, al)
+  p.close()
+  p.join()
+  for log in l:
+    # Error in worker (message has already been printed)
+    if isinstance(log, SystemExit):
+      sys.exit(log.code)
   return l
 
+### Get a single log (see get_logs())
+# The format of the file is determined from its first bytes (see open_log())
+def get_log(f, lh, fix_names, drop_dups, drop_numeric, jobs=1, mapped=False,
+  cache=None):
+  fo, fmt = open_log(f)
+  try:
+    return read_log(f, fo, fmt, lh, fix_names, drop_dups, drop_numeric, jobs,
+      mapped, cache)
+  finally:
+    fo.close()
+
+### Open file and determine its format from its first bytes (see get_format())
+# Returns: file opened in binary mode (at its start), and format
+def open_log(f):
+  fo = open(f, 'rb')
+  fmt = get_format(fo.read(magic_len))
+  fo.seek(0)
+  return fo, fmt
+
+### Read log of the given format from file f opened as fo (see open_log()), with
+# the reader of the format (see log_readers)
+def read_log(f, fo, fmt, lh, fix_names, drop_dups, drop_numeric, jobs=1,
+  mapped=False, cache=None):
+  log = log_readers[fmt](f, fo, lh, fix_names, drop_dups, drop_numeric, jobs,
+    mapped, cache)
+  log.verify()
+  chk(type(log) == lh, 'wrong log type (maybe use -i)')
+  return log
+
+def read_text_log(f, fo, lh, fix_names, drop_dups, drop_numeric, jobs, mapped,
+  cache):
+  if cache:
+    return get_cached_log(f, fo, lh, fix_names, drop_dups, drop_numeric, jobs,
+      mapped, cache)
+  log = lh()
+  print('opening file ' + f + ' as textual litmus log')
+  log.from_file(f, fix_names, drop_dups, drop_numeric, jobs, mapped, fo)
+  return log
+
+def read_pickle_log(f, fo, lh, fix_names, drop_dups, drop_numeric, jobs, mapped,
+  cache):
+  log = unpickle(f, fo)
+  print('unpickled file ' + f)
+  return log
+
+def read_store_log(f, fo, lh, fix_names, drop_dups, drop_numeric, jobs, mapped,
+  cache):
+  log = load_store(f, fo)
+  print('loaded log store ' + f)
+  return log
+
+# Compressed textual log or pickle; the file is decompressed while reading it
+# (memory mapping does not apply)
+def read_compressed_log(codec, f, fo, lh, fix_names, drop_dups, drop_numeric,
+  jobs, mapped, cache):
+  c = codec.open(fo)
+  try:
+    # The decompressed bytes are looked at without consuming them
+    fmt = get_format(c.peek(magic_len)[:magic_len])
+    if fmt == 'pickle':
+      log = pickle.load(c)
+      print('unpickled compressed file ' + f)
+      return log
+    chk(fmt == 'text', 'unsupported compressed log format: ' + fmt)
+    if cache:
+      return get_cached_log(f, fo, lh, fix_names, drop_dups, drop_numeric,
+        jobs, False, cache, c)
+    log = lh()
+    print('opening file ' + f + ' as compressed textual litmus log')
+    log.from_file(f, fix_names, drop_dups, drop_numeric, jobs, False, c)
+    return log
+  finally:
+    c.close()
+
+### Get textual log via the parse cache
+# The cache holds log stores named by a hash of the content of a textual log
+# and of the options that affect parsing it. If there is none for the current
+# content, but one for a prefix of the log (i.e., the log has been appended to
+# since), only the rest of the log is parsed (see Log.from_source()). The
+# checkpoint of the last parse of a log is kept in a file named by a hash of
+# the path of the log and the options. Compressed logs are always parsed in
+# full (see Log.from_file()).
+# fo: file f opened in binary mode
+# c: stream decompressing fo if the log is compressed (or None)
+def get_cached_log(f, fo, lh, fix_names, drop_dups, drop_numeric, jobs, mapped,
+  cache, c=None):
+  opts = repr([lh.__name__, fix_names, drop_dups, drop_numeric, store_version])
+  # Contents of the log at this point (it may still be appended to)
+  src = LogSource(f, fo)
+  b = src.get_buffer()
+
+  h = hashlib.sha256(opts.encode())
+  h.update(b)
+  cf = os.path.join(cache, h.hexdigest() + '.log')
+  if os.path.isfile(cf):
+    log = load_store(cf)
+    set_log_name(log, f)
+    print('loaded cached textual litmus log ' + f)
+    return log
+
+  if c:
+    log = lh()
+    print('opening file ' + f + ' as compressed textual litmus log')
+    log.from_file(f, fix_names, drop_dups, drop_numeric, jobs, False, c)
+    log.verify()
+    write_file(cf, partial(write_store, log))
+    return log
+
+  h = hashlib.sha256(opts.encode())
+  h.update(os.path.abspath(f).encode())
+  pf = os.path.join(cache, h.hexdigest() + '.checkpoint')
+  log, checkpoint, old = load_checkpoint(pf, b)
+  if log:
+    set_log_name(log, f)
+    print('resuming textual litmus log ' + f + ' at byte ' +
+      str(checkpoint[0]) + ' (dropped tests are counted from there on)')
+  else:
+    log = lh()
+    log.fn = f
+    print('opening file ' + f + ' as textual litmus log')
+  log.from_source(src, fix_names, drop_dups, drop_numeric, jobs, mapped,
+    checkpoint)
+  log.verify()
+
+  write_file(cf, partial(write_store, log))
+  offset, count, digest = log.checkpoint
+  s = ' '.join([str(offset), str(count), digest, os.path.basename(cf)])
+  write_file(pf, partial(w_str, s=s + '\n'))
+  # The store of the earlier read is superseded (only the latest store of a
+  # log is kept, such that the cache does not grow as the log is appended to)
+  if old and old != cf:
+    if checkpoint:
+      # The entries of the earlier read take their raw texts from its store,
+      # so the log is read from the new store before the old one is removed
+      log = load_store(cf)
+      log.checkpoint = (offset, count, digest)
+    try:
+      os.remove(old)
+    except FileNotFoundError:
+      pass
+  return log
+
+# Returns: log of the checkpoint, pair of offset and number of entries (see
+#   Log.from_source()), and path of the store of the checkpoint; the first two
+#   are None if there is no checkpoint or it does not match the log
+def load_checkpoint(pf, b):
+  if not os.path.isfile(pf):
+    return None, None, None
+  fo = open(pf, 'r')
+  l = fo.read().split()
+  fo.close()
+  if len(l) != 4:
+    return None, None, None
+  offset, count, digest, cf = int(l[0]), int(l[1]), l[2], l[3]
+  cf = os.path.join(os.path.dirname(pf), cf)
+  if offset > len(b) or not os.path.isfile(cf):
+    return None, None, None
+  if hashlib.sha256(memoryview(b)[:offset]).hexdigest() != digest:
+    return None, None, cf
+  return load_store(cf), (offset, count), cf
+
+# Log from the cache may have been read from a file with another name
+def set_log_name(log, f):
+  log.verify()
+  if log.fn != f:
+    log.fn = f
+    f = sys.intern(f)
+    for le in log.get_all():
+      le.parent = f
+
+# Write file by calling w with a temporary file, which then replaces f
+# atomically (concurrent loaders may write the same cache entry)
+def write_file(f, w):
+  d = os.path.dirname(f)
+  os.makedirs(d, exist_ok=True)
+  fd, tmp = tempfile.mkstemp(dir=d, suffix='.tmp')
+  os.close(fd)
+  try:
+    w(tmp)
+    os.replace(tmp, f)
+  except:
+    os.remove(tmp)
+    raise
+
+### Get the entries of a log in key order
+# Log stores are read entry by entry (see stream_store()), logs of other
+# formats are read in full (see get_log())
+# Returns: iterator of (key, entry)
+def get_entry_stream(f, lh, jobs=1, mapped=False, cache=None):
+  fo, fmt = open_log(f)
+  try:
+    if fmt != 'store':
+      log = read_log(f, fo, fmt, lh, False, False, False, jobs, mapped, cache)
+      return iter(sorted(log.d.items()))
+    c, fn, it = stream_store(f, fo)
+  finally:
+    fo.close()
+  chk(c == lh, 'wrong log type (maybe use -i)')
+  print('streaming log store ' + f)
+  return it
+
+### Get the keys of a log (sorted)
+# Log stores are read without decoding their entries (see load_store_keys()),
+# logs of other formats are read in full (see get_log())
+def get_log_keys(f, lh, jobs=1, mapped=False, cache=None):
+  fo, fmt = open_log(f)
+  try:
+    if fmt != 'store':
+      log = read_log(f, fo, fmt, lh, False, False, False, jobs, mapped, cache)
+      return sorted(log.get_keys())
+    c, fn, ks = load_store_keys(f, fo)
+  finally:
+    fo.close()
+  chk(c == lh, 'wrong log type (maybe use -i)')
+  print('loaded keys of log store ' + f)
+  return ks
+
+### Get the counts of the entries of a log
+# Log stores are read without decoding their entries (see load_store_fields()),
+# logs of other formats are read in full (see get_log())
+# Returns: filename of the log, and ordered dict mapping keys to EntryCounts (in
+#   log order)
+def get_log_counts(f, lh, jobs=1, mapped=False, cache=None):
+  fo, fmt = open_log(f)
+  try:
+    if fmt != 'store':
+      log = read_log(f, fo, fmt, lh, False, False, False, jobs, mapped, cache)
+      return log.fn, collections.OrderedDict((k, EntryCounts(le.pos, le.neg,
+        le.total, le.flags)) for k, le in log.d.items())
+    c, fn, d = load_store_fields(f, fo)
+  finally:
+    fo.close()
+  chk(c == lh, 'wrong log type (maybe use -i)')
+  print('loaded counts of log store ' + f)
+  return fn, d
+
+### Merge entry streams (see get_entry_stream()) by key
+# Returns: iterator of (key, list of (position of stream, entry)) in key order,
+#   with the entries in the order of the streams
+def merge_entry_streams(its):
+  def tag(j, it):
+    for k, le in it:
+      yield k, j, le
+  m = heapq.merge(*[tag(j, it) for j, it in enumerate(its)])
+  for k, g in itertools.groupby(m, key=lambda t: t[0]):
+    yield k, [(j, le) for _, j, le in g]
+
+# Runs in a worker process of get_logs(); returns the exception if chk() fails
+# as a worker must not exit
+def get_log_worker(a):
+  try:
+    return get_log(*a)
+  except SystemExit as e:
+    return e
+
+# Argument type of the number of jobs
+def jobs_arg(s):
+  try:
+    n = int(s)
+  except ValueError:
+    n = 0
+  if n < 1:
+    raise argparse.ArgumentTypeError('invalid number of jobs: ' + s)
+  return n
+
+### Add options for get_logs() to command line parser
+def add_input_options(p):
+  p.add_argument('-j', '--jobs', type=jobs_arg, default=1,
+    help='number of processes to use for loading logs (default: 1)')
+  p.add_argument('-c', '--cache', default=os.environ.get('LOG_CACHE'),
+    help='directory in which to cache parsed textual logs (default: $LOG_CACHE\
+ if set, otherwise no caching)')
+  p.add_argument('-m', '--mmap', dest='mapped', action='store_true',
+    help='memory-map textual logs and read the text of a test from the log\
+ only when needed (the log must not be moved or changed while in use)')
+
 ### Get entry from first log that has key
 def get_entry(key, logs):
+  if isinstance(logs, LogSet):
+    return logs.get_entry(key)
   logs = listify(logs)
   assert(len(logs) > 0)
   for log in logs:
@@ -103,54 +400,44 @@ def get_entry(key, logs):
       return le
   assert(False)
 
-# ------------------------------------------------------------------------------
-# Helper functions
-
-# Parse action for determining e.g. is_cta()
-def f1(tokens):
-  for t in tokens:
-    if t == False:
-      return t
-  if len(tokens) > 1:
-    return False
-  return True
-
-# Parse action for determining e.g. is_cta()
-def f2(tokens):
-  for t in tokens:
-    if t == False:
-      return t
-  if len(tokens) < 2:
-    return False
-  return True
-
 # ------------------------------------------------------------------------------
 # Get key sets
 
+# The functions below take a list of logs or a LogSet. The latter should be
+# passed when several key sets are taken from the same logs.
+
 ### Get keys over all logs in list
 def get_keys(logs):
+  if isinstance(logs, LogSet):
+    return logs.get_keys()
   logs = listify(logs)
-  ks = map(lambda log: [x for x in log.d.keys()], logs)
-  ks = reduce(lambda a, b: list(set(a + b)), ks, [])
-  ks.sort()
-  return ks
+  ks = set()
+  for log in logs:
+    ks.update(log.get_keys())
+  return sorted(ks)
 
 ### Return keys over all logs matching a regular expression
 def get_matching_keys(regexes, logs, ks=None):
-  logs = listify(logs)
   if ks == None:
     ks = get_keys(logs)
-  l = [] 
-  for k in ks:
-    for r in regexes:
-      if re.match(r, k):
-        l.append(k)
-        break
+  cl = classify_keys([regexes], ks)
+  return [k for k, c in zip(ks, cl) if c == 0]
+
+### Get keys per class (see KeyMatcher)
+# classes: list of lists of regular expressions
+# Returns: list of lists of keys (parallel to classes)
+def get_classified_keys(classes, logs, ks=None):
+  if ks == None:
+    ks = get_keys(logs)
+  cl = classify_keys(classes, ks)
+  l = [[] for c in classes]
+  for k, c in zip(ks, cl):
+    if c >= 0:
+      l[c].append(k)
   return l
 
 ### Get keys with filter function applied to all log entries
 def get_filtered_keys(filt, logs, ks=None):
-  logs = listify(logs)
   if ks == None:
     ks = get_keys(logs)
   l = []
@@ -162,31 +449,622 @@ def get_filtered_keys(filt, logs, ks=None):
 
 ### Get positive keys
 def get_pos_keys(logs, ks=None):
-  logs = listify(logs)
   if ks == None:
     ks = get_keys(logs)
+  if isinstance(logs, LogSet):
+    get_entries = logs.get_entries
+  else:
+    logs = listify(logs)
+    get_entries = lambda k: [log.get(k) for log in logs]
   l = []
   for k in ks:
-    for log in logs:
-      e = log.get(k)
+    for e in get_entries(k):
       if e and e.is_pos():
         l.append(k)
         break
   return l
 
+# ------------------------------------------------------------------------------
+# Key patterns
+
+# Several lists of regular expressions (classes), compiled into a single
+# regular expression such that a key is classified with one match. A key is in
+# the first class that has a pattern matching at the start of the key (as with
+# re.match()); classes that are empty match no key. Patterns that refer to
+# groups (backreferences such as \1, named groups) are not combined, as
+# combining them renumbers the groups.
+class KeyMatcher:
+  """Compiled lists of key patterns"""
+
+  def __init__(self, classes):
+    assert(all(lty(c, str) for c in classes))
+    self.classes = classes
+    # Group name -> class
+    self.groups = dict()
+    l = []
+    for i, c in enumerate(classes):
+      if not c:
+        continue
+      g = 'k' + str(i)
+      self.groups[g] = i
+      l.append('(?P<' + g + '>' + '|'.join(['(?:' + r + ')' for r in c]) + ')')
+    self.r = None
+    self.rs = None
+    try:
+      if not any(group_ref.search(r) for c in classes for r in c) and l:
+        self.r = re.compile('|'.join(l))
+    except re.error:
+      pass
+    if self.r == None and l:
+      # Patterns that cannot be combined (e.g. with global flags or group
+      # references) are matched one by one
+      self.rs = [[re.compile(r) for r in c] for c in classes]
+
+  ### Get class of key (position in classes), or -1 if it matches no class
+  def classify(self, k):
+    if self.rs != None:
+      for i, c in enumerate(self.rs):
+        for r in c:
+          if r.match(k):
+            return i
+      return -1
+    if self.r == None:
+      return -1
+    m = self.r.match(k)
+    if not m:
+      return -1
+    # The group of the class closes last
+    return self.groups[m.lastgroup]
+
+# Numbered or named backreference, named group, or conditional on a group in a
+# pattern (an escaped backslash followed by a digit also matches, which only
+# means that the pattern is not combined)
+group_ref = re.compile(r'\\[1-9]|\(\?P[<=]|\(\?\(')
+
+# Matchers by tuple of classes
+key_matchers = dict()
+
+### Get (shared) matcher of classes
+def get_key_matcher(classes):
+  t = tuple(map(tuple, classes))
+  km = key_matchers.get(t)
+  if km == None:
+    km = KeyMatcher([list(c) for c in t])
+    key_matchers[t] = km
+  return km
+
+### Classify keys
+# Returns: list of classes (parallel to ks, see KeyMatcher.classify())
+def classify_keys(classes, ks):
+  km = get_key_matcher(classes)
+  return [km.classify(k) for k in ks]
+
 # ------------------------------------------------------------------------------
 # Pickle
 
-def unpickle(f):
+### Read log from pickle
+# Logs are written as log stores (see write_store()); pickles written by
+# earlier versions of the scripts can still be read
+# fo: file f opened in binary mode (or None)
+def unpickle(f, fo=None):
+  if fo:
+    return pickle.load(fo)
   f = open(f, "rb")
   b = pickle.load(f)
   f.close()
   return b
 
-def gherkin(log, f):
-  f = open(f, "wb")
-  pickle.dump(log, f)
-  f.close()
+# ------------------------------------------------------------------------------
+# Binary log store
+
+# Layout of a log store (integers are little endian, offsets are relative to
+# the start of the file):
+# - header (see store_header)
+# - filename of the log
+# - key index: one record per entry (see store_index), sorted by key
+# - keys
+# - numeric fields: one record per entry (see store_fields), in log order
+# - per entry name, short name, kind, scope tree, parent, and memory map,
+#   separated by '\0'
+# - raw texts of the entries
+# All strings are utf-8 encoded. The raw texts are read on demand from the
+# store (see RawFile).
+
+store_magic = b'\x89GPULOG\n'
+store_version = 2
+
+# magic, version, log class (0: Log, 1: LogInc), number of entries, offsets of
+# key index, keys, fields, records, raw texts, and end of file
+store_header = struct.Struct('<8sHBxI6Q')
+# offset and length of key, entry number (position in log), offset and length
+# of record, offset and length of raw text
+store_index = struct.Struct('<QIIQIQI')
+# pos, neg, total, flags, which of pos/neg/total are floats (bits 0/1/2);
+# integer counts are stored as int64, floats by the bits of their double
+store_fields = struct.Struct('<qqqBB')
+store_double = struct.Struct('<d')
+store_int = struct.Struct('<q')
+
+### Write log to store
+def write_store(log, f):
+  assert(type(log) == Log or type(log) == LogInc)
+  ks = [k.encode() for k in log.get_keys()]
+  les = log.get_all()
+  n = len(les)
+  assert(len(ks) == n)
+
+  fields = []
+  recs = []
+  raws = []
+  for le in les:
+    field, rec, raw = pack_store_entry(le)
+    fields.append(field)
+    recs.append(rec)
+    raws.append(raw)
+
+  meta = log.fn.encode()
+  index_off = store_header.size + len(meta)
+  keys_off = index_off + n * store_index.size
+  fields_off = keys_off + sum(map(len, ks))
+  recs_off = fields_off + n * store_fields.size
+  raw_off = recs_off + sum(map(len, recs))
+  end = raw_off + sum(map(len, raws))
+
+  # Index records in log order
+  index = []
+  ko, ro, wo = keys_off, recs_off, raw_off
+  for i in range(n):
+    index.append(store_index.pack(ko, len(ks[i]), i, ro, len(recs[i]), wo,
+      len(raws[i])))
+    ko += len(ks[i])
+    ro += len(recs[i])
+    wo += len(raws[i])
+  order = sorted(range(n), key=lambda i: ks[i])
+
+  fo = open(f, 'wb')
+  fo.write(store_header.pack(store_magic, store_version,
+    int(type(log) == LogInc), n, index_off, keys_off, fields_off, recs_off,
+    raw_off, end))
+  fo.write(meta)
+  fo.write(b''.join([index[i] for i in order]))
+  fo.write(b''.join(ks))
+  fo.write(b''.join(fields))
+  fo.write(b''.join(recs))
+  fo.write(b''.join(raws))
+  fo.close()
+
+# Returns: numeric fields (see store_fields), record, and raw text of entry
+def pack_store_entry(le):
+  ty = 0
+  l = []
+  for i, x in enumerate([le.pos, le.neg, le.total]):
+    if type(x) == float:
+      ty |= 1 << i
+      x = store_int.unpack(store_double.pack(x))[0]
+    l.append(x)
+  field = store_fields.pack(*l, le.flags, ty)
+  mm = ';'.join([var + ':' + space for var, space in le.memorymap])
+  r = [le.name, le.short_name, le.kind, le.scopetree, le.parent, mm]
+  rec = '\0'.join(r).encode()
+  raw = le.get_raw().encode()
+  return field, rec, raw
+
+# Writes a log store entry by entry, with the entries in key order (the
+# sections of the store are collected in temporary files, such that the
+# entries need not be kept in memory)
+class StoreWriter:
+  """Log store that is written entry by entry"""
+
+  # f: filename of the store, fn: filename of the log, lh: log class
+  def __init__(self, f, fn, lh):
+    assert(lh == Log or lh == LogInc)
+    self.f = f
+    self.fn = fn
+    self.lh = lh
+    self.n = 0
+    self.last = None
+    # Index (offsets relative to the sections), keys, fields, records, raw
+    # texts
+    self.parts = [tempfile.TemporaryFile() for i in range(5)]
+    self.sizes = [0] * 5
+
+  def add(self, k, le):
+    assert(type(le) == LogEntry)
+    assert(self.last == None or self.last < k)
+    self.last = k
+    key = k.encode()
+    field, rec, raw = pack_store_entry(le)
+    _, ko, _, ro, wo = self.sizes
+    index = store_index.pack(ko, len(key), self.n, ro, len(rec), wo, len(raw))
+    for i, b in enumerate([index, key, field, rec, raw]):
+      self.parts[i].write(b)
+      self.sizes[i] += len(b)
+    self.n += 1
+
+  def close(self):
+    meta = self.fn.encode()
+    index_off = store_header.size + len(meta)
+    offs = [index_off]
+    for size in self.sizes:
+      offs.append(offs[-1] + size)
+    _, keys_off, fields_off, recs_off, raw_off, end = offs
+
+    fo = open(self.f, 'wb')
+    fo.write(store_header.pack(store_magic, store_version,
+      int(self.lh == LogInc), self.n, index_off, keys_off, fields_off,
+      recs_off, raw_off, end))
+    fo.write(meta)
+    # Index with offsets relative to the start of the file
+    index = self.parts[0]
+    index.seek(0)
+    for i in range(self.n):
+      ko, kn, j, ro, rn, wo, wn = store_index.unpack(
+        index.read(store_index.size))
+      fo.write(store_index.pack(ko + keys_off, kn, j, ro + recs_off, rn,
+        wo + raw_off, wn))
+    for part in self.parts[1:]:
+      part.seek(0)
+      shutil.copyfileobj(part, fo)
+    fo.close()
+    for part in self.parts:
+      part.close()
+
+# Returns: header fields (see store_header) and filename of the log
+def read_store_header(fo):
+  b = fo.read(store_header.size)
+  chk(len(b) == store_header.size, 'truncated log store')
+  h = store_header.unpack(b)
+  chk(h[0] == store_magic, 'not a log store')
+  chk(h[1] == store_version, 'unsupported log store version ' + str(h[1]))
+  index_off = h[4]
+  fn = fo.read(index_off - store_header.size).decode()
+  return h, fn
+
+# Read region [off, end) of store
+def read_store_region(fo, off, end):
+  fo.seek(off)
+  b = fo.read(end - off)
+  chk(len(b) == end - off, 'truncated log store')
+  return b
+
+# Returns: list of (key, entry number, record span, raw text span), sorted by
+#   key
+def read_store_index(fo, h):
+  _, _, _, n, index_off, keys_off, fields_off, _, _, _ = h
+  b = read_store_region(fo, index_off, fields_off)
+  l = []
+  for ko, kn, i, ro, rn, wo, wn in store_index.iter_unpack(b[:keys_off -
+    index_off]):
+    ko -= index_off
+    l.append((b[ko:ko+kn].decode(), i, (ro, rn), (wo, wn)))
+  assert(len(l) == n)
+  return l
+
+# Returns: list of (pos, neg, total, flags) in log order
+def read_store_fields(fo, h):
+  _, _, _, n, _, _, fields_off, recs_off, _, _ = h
+  b = read_store_region(fo, fields_off, recs_off)
+  l = [unpack_store_fields(t) for t in store_fields.iter_unpack(b)]
+  assert(len(l) == n)
+  return l
+
+# t: unpacked record of store_fields
+# Returns: (pos, neg, total, flags)
+def unpack_store_fields(t):
+  *l, flags, ty = t
+  for i in range(3):
+    if ty & (1 << i):
+      l[i] = store_double.unpack(store_int.pack(l[i]))[0]
+  pos, neg, total = l
+  return pos, neg, total, flags
+
+# Entry from its record, numeric fields (see unpack_store_fields()), raw file,
+# and span of its raw text
+def read_store_entry(rec, fields, rf, span):
+  r = rec.decode().split('\0')
+  chk(len(r) == 6, 'corrupt log store')
+  name, short_name, kind, scopetree, parent, mm = r
+  if mm:
+    mm = [el.split(':') for el in mm.split(';')]
+  else:
+    mm = []
+  pos, neg, total, flags = fields
+  le = LogEntry.__new__(LogEntry)
+  le.__setstate__({'raw': '', 'rawsrc': rf if span[1] else None,
+    'rawspan': span if span[1] else None, 'raw_fixed': '', 'name': name,
+    'short_name': short_name, 'kind': kind, 'scopetree': scopetree,
+    'st': None, 'memorymap': mm, 'pos': pos, 'neg': neg, 'total': total,
+    'flags': flags, 'parent': parent})
+  return le
+
+### Read only the keys of a log store (the entries are not decoded)
+# fo: file f opened in binary mode (or None)
+# Returns: log class, filename of the log, and list of keys (sorted)
+def load_store_keys(f, fo=None):
+  c = not fo
+  if c:
+    fo = open(f, 'rb')
+  h, fn = read_store_header(fo)
+  index = read_store_index(fo, h)
+  if c:
+    fo.close()
+  return LogInc if h[2] else Log, fn, [k for k, _, _, _ in index]
+
+### Read only the numeric fields of a log store (the records and raw texts are
+# not read)
+# fo: file f opened in binary mode (or None)
+# Returns: log class, filename of the log, and ordered dict mapping keys to
+#   EntryCounts (in log order)
+def load_store_fields(f, fo=None):
+  c = not fo
+  if c:
+    fo = open(f, 'rb')
+  h, fn = read_store_header(fo)
+  index = read_store_index(fo, h)
+  fields = read_store_fields(fo, h)
+  if c:
+    fo.close()
+  ks = [None] * len(index)
+  for k, i, _, _ in index:
+    ks[i] = k
+  d = collections.OrderedDict(zip(ks, [EntryCounts(*t) for t in fields]))
+  return LogInc if h[2] else Log, fn, d
+
+### Read log from store
+# fo: file f opened in binary mode (or None)
+def load_store(f, fo=None):
+  c = not fo
+  if c:
+    fo = open(f, 'rb')
+  h, fn = read_store_header(fo)
+  _, _, inc, n, _, _, _, recs_off, raw_off, end = h
+  index = read_store_index(fo, h)
+  fields = read_store_fields(fo, h)
+  recs = read_store_region(fo, recs_off, raw_off)
+  if c:
+    fo.close()
+
+  log = LogInc() if inc else Log()
+  log.fn = fn
+  rf = RawFile(os.path.abspath(f), end)
+
+  l = [None] * n
+  for k, i, (ro, rn), span in index:
+    ro -= recs_off
+    l[i] = (k, read_store_entry(recs[ro:ro+rn], fields[i], rf, span))
+  log.d = collections.OrderedDict(l)
+  return log
+
+### Read the entries of a log store one by one, in key order (the store is
+# memory-mapped, and only the current entry is kept in memory)
+# fo: file f opened in binary mode (or None); the store is then mapped from it
+# Returns: log class, filename of the log, and iterator of (key, entry)
+def stream_store(f, fo=None):
+  c = not fo
+  if c:
+    fo = open(f, 'rb')
+  h, fn = read_store_header(fo)
+  _, _, inc, n, index_off, _, fields_off, _, _, end = h
+  rf = RawFile(os.path.abspath(f), end)
+  if c:
+    fo.close()
+  else:
+    rf.get_buffer(fo)
+  def entries():
+    b = rf.get_buffer()
+    for j in range(n):
+      ko, kn, i, ro, rn, wo, wn = store_index.unpack_from(b,
+        index_off + j * store_index.size)
+      k = b[ko:ko+kn].decode()
+      fields = unpack_store_fields(store_fields.unpack_from(b,
+        fields_off + i * store_fields.size))
+      yield k, read_store_entry(b[ro:ro+rn], fields, rf, (wo, wn))
+  return LogInc if inc else Log, fn, entries()
+
+# ------------------------------------------------------------------------------
+# Log formats
+
+# Formats identified by the bytes at the start of a file (checked in order);
+# files of no other format are textual litmus logs
+log_formats = [
+  ('store', store_magic),
+  # Pickle protocol 2 and later
+  ('pickle', b'\x80'),
+  ('gzip', b'\x1f\x8b'),
+  ('bz2', b'BZh'),
+  ('xz', b'\xfd7zXZ\x00')
+]
+
+# Decompressors by format (modules providing open())
+log_codecs = {
+  'gzip': gzip,
+  'bz2': bz2,
+  'xz': lzma
+}
+
+# Readers by format (called by read_log() with its arguments, except fmt)
+log_readers = {
+  'text': read_text_log,
+  'pickle': read_pickle_log,
+  'store': read_store_log,
+  'gzip': partial(read_compressed_log, gzip),
+  'bz2': partial(read_compressed_log, bz2),
+  'xz': partial(read_compressed_log, lzma)
+}
+
+# Number of bytes needed to determine the format of a file
+magic_len = max([len(m) for _, m in log_formats])
+
+### Get format of file from its first bytes (at least magic_len of them unless
+# the file is shorter)
+def get_format(b):
+  for fmt, m in log_formats:
+    if b.startswith(m):
+      return fmt
+  return 'text'
+
+### Add reader for files starting with the given magic bytes
+def register_format(fmt, magic, reader):
+  global magic_len
+  assert(fmt not in log_readers)
+  log_formats.append((fmt, magic))
+  log_readers[fmt] = reader
+  magic_len = max(magic_len, len(magic))
+
+# ------------------------------------------------------------------------------
+# Scope trees
+
+# Scope class of a test (derived from its scope tree)
+class Scope(enum.IntEnum):
+  thread = 0
+  warp = 1
+  cta = 2
+  ker = 3
+  dev = 4
+  mixed = 5
+
+# Scope tree of a litmus test, e.g. (device (kernel (cta (warp P0) (warp P1))))
+#
+# Instances are immutable and interned (there is one instance per distinct
+# scope tree, shared between all log entries with that scope tree). The scope
+# class and the pretty printed forms are computed once on creation.
+#
+# s: normalized scope tree
+# scope: scope class (Scope)
+# name: for use in test names (e.g. p0:p1)
+# html: for use in html tables
+# latex: for use in latex tables
+class ScopeTree(collections.namedtuple('ScopeTree',
+  ['s', 'scope', 'name', 'html', 'latex'])):
+  """Scope tree of a litmus test"""
+
+  __slots__ = ()
+
+  # Re-intern on unpickling
+  def __reduce__(self):
+    return (get_scope_tree, (self.s,))
+
+# Scope trees seen so far (normalized scope tree -> ScopeTree)
+scope_trees = dict()
+# Scope trees as they appear in logs (string -> ScopeTree)
+scope_tree_strs = dict()
+
+### Get scope tree object for string (parsed once per distinct string)
+def get_scope_tree(st):
+  t = scope_tree_strs.get(st)
+  if t:
+    return t
+  tree = parse_scope_tree(st)
+  ns = ' '.join(map(scope_tree_node_str, tree))
+  t = scope_trees.get(ns)
+  if not t:
+    t = ScopeTree(ns, classify_scope_tree(tree),
+      fold_scope_tree(tree, ppi_thread_name, ['', ':', '::', ':::', '::::']),
+      fold_scope_tree(tree, pp_thread, [' ', ' |<sub>warp</sub> ',
+        ' |<sub>cta</sub> ', ' |<sub>ker</sub> ', ' |<sub>dev</sub> ']),
+      # Threads as in the html form (as printed by log2tbl so far)
+      fold_scope_tree(tree, pp_thread, [' ', ' |_{warp} ', ' |_{cta} ',
+        ' |_{ker} ', ' |_{dev} ']))
+    scope_trees[ns] = t
+  scope_tree_strs[st] = t
+  return t
+
+# Tokens of a scope tree (whitespace is skipped)
+st_tok = re.compile(r'\s*(\(|\)|device|kernel|cta|warp|[Pp][0-9]+)')
+st_thread = re.compile(r'[Pp][0-9]+')
+st_levels = ['device', 'kernel', 'cta', 'warp']
+
+### Parse scope tree
+# Grammar (anything after the last device node is ignored):
+#   st := dn+, dn := ( device kn+ ), kn := ( kernel cn+ ), cn := ( cta wn+ ),
+#   wn := ( warp [Pp][0-9]+ + )
+# Returns: nested lists of devices, kernels, ctas, and warps; the innermost
+# lists contain the thread names
+def parse_scope_tree(st):
+  toks = []
+  pos = 0
+  while True:
+    mo = st_tok.match(st, pos)
+    if not mo:
+      break
+    toks.append(mo.group(1))
+    pos = mo.end()
+  toks += ['', '']
+
+  # Parse node of the given level at token i; returns (node, next token) or
+  # None
+  def node(level, i):
+    if toks[i] != '(' or toks[i+1] != st_levels[level]:
+      return None
+    i += 2
+    l = []
+    while True:
+      if level == len(st_levels) - 1:
+        if not st_thread.fullmatch(toks[i]):
+          break
+        r = (toks[i], i+1)
+      else:
+        r = node(level+1, i)
+        if not r:
+          break
+      l.append(r[0])
+      i = r[1]
+    if not l or toks[i] != ')':
+      return None
+    return l, i+1
+
+  tree = []
+  i = 0
+  while True:
+    r = node(0, i)
+    if not r:
+      break
+    tree.append(r[0])
+    i = r[1]
+  chk(tree, ErrMsg.logform)
+  return tree
+
+# Normalized string of a node of a parsed scope tree
+def scope_tree_node_str(n, level=0):
+  if level == len(st_levels) - 1:
+    l = n
+  else:
+    l = [scope_tree_node_str(c, level+1) for c in n]
+  return '(' + st_levels[level] + ' ' + ' '.join(l) + ')'
+
+### Determine scope class of parsed scope tree
+# The threads are in different <x> but in the same <y> (e.g. different warps,
+# same cta) if exactly one node branches, and that node is a <y>
+def classify_scope_tree(tree):
+  # Levels: tree (devices), device, kernel, cta, warp (threads)
+  scs = [Scope.dev, Scope.ker, Scope.cta, Scope.warp, Scope.thread]
+  nodes = [tree]
+  branching = []
+  for sc in scs:
+    if any(len(n) != 1 for n in nodes):
+      branching.append(sc)
+    nodes = [c for n in nodes for c in n]
+  if len(branching) == 1:
+    return branching[0]
+  return Scope.mixed
+
+### Join the nodes of a parsed scope tree bottom-up
+# f: maps a thread name to a string
+# seps: separators between threads, warps, ctas, kernels, and devices
+def fold_scope_tree(tree, f, seps):
+  def g(n, i):
+    if i == 0:
+      return seps[0].join(map(f, n))
+    return seps[i].join([g(c, i-1) for c in n])
+  return g(tree, len(seps) - 1)
+
+def ppi_thread_name(t):
+  assert(re.fullmatch('[Pp][0-9]', t))
+  return 'p' + t[1]
+
+def pp_thread(t):
+  assert(re.fullmatch('[Pp][0-9]', t))
+  return t[0] + '<sub>' + t[1] + '</sub>'
 
 # ------------------------------------------------------------------------------
 # Parsing, processing, and printing a single log entry
@@ -221,6 +1099,14 @@ class InconsistentTestsError(Exception):
   def __repr__(self):
     return self.s
 
+# Canonical memory maps, shared by all entries with the same memory map
+memory_maps = dict()
+
+### Get canonical memory map (tuple of pairs of variable and memory space)
+def get_memory_map(mm):
+  t = tuple([(sys.intern(var), sys.intern(space)) for var, space in mm])
+  return memory_maps.setdefault(t, t)
+
 class LogEntry:
   """Entry in a litmus log corresponding to a successful test"""
 
@@ -228,36 +1114,108 @@ class LogEntry:
   mem_norm = {'g': 'g', 's': 's', 'l': 's',
               'global': 'g', 'shared': 's', 'local': 's'}
 
+  # Entries are numerous, hence no per-instance dict
+  __slots__ = ('raw', 'rawsrc', 'rawspan', 'raw_fixed', 'name', 'short_name',
+    'kind', 'scopetree', 'st', 'memorymap', 'pos', 'neg', 'total', 'flags',
+    'parent')
+
+  # Bits of flags (incantations, and whether fix_name() has been applied)
+  general_bc_bit = 0x1
+  mem_stress_bit = 0x2
+  rand_threads_bit = 0x4
+  barrier_bit = 0x8
+  fixed_bit = 0x10
+  incantation_bits = general_bc_bit | mem_stress_bit | rand_threads_bit |\
+    barrier_bit
+
+  # Bits of the memory class (an entry with an empty memory map is both global
+  # and shared, see get_mem())
+  mem_global_bit = 0x1
+  mem_shared_bit = 0x2
+
+  # String fields that are interned
+  interned = ['name', 'short_name', 'kind', 'scopetree', 'parent']
+
   def __init__(self, s, parent=""):
 
+    # Raw text of the entry; empty if it is kept in the source log (rawsrc) at
+    # the span rawspan = (offset, length)
     self.raw = ""
+    self.rawsrc = None
+    self.rawspan = None
+    # Raw text with the name produced by fix_name(); empty if the name has not
+    # been fixed or if the raw text is kept in the source log (see
+    # get_raw_fixed())
     self.raw_fixed = ""
+    # The strings in interned and the memory map are shared among all
+    # entries with the same value
     self.name = ""
     # Name without scope and memory region designator
     self.short_name = ""
-    # Set to name currently
+    # Set to name currently (not changed by fix_name())
     self.kind = ""
 
     self.scopetree = ""
-    # List of pairs of string: [(x, global), (y, shared), ...]
-    self.memorymap = []
+    # Interned scope tree object (see get_st())
+    self.st = None
+    # Tuple of pairs of string: ((x, global), (y, shared), ...)
+    self.memorymap = ()
 
     # Frequencies
     self.pos = 0
     self.neg = 0
     self.total = 0
 
-    # Incantations
-    self.general_bc = False
-    self.mem_stress = False
-    self.rand_threads = False
-    self.barrier = False
+    # Incantations and whether the name has been fixed (see *_bit above)
+    self.flags = 0
 
     # Link to the log this entry is part of (string name)
-    self.parent = parent
+    self.parent = sys.intern(parent)
 
     self.parse(s)
 
+  def __getstate__(self):
+    return dict((k, getattr(self, k)) for k in self.__slots__)
+
+  def __setstate__(self, state):
+    if 'flags' not in state:
+      state = self.convert_state(state)
+    for k in self.__slots__:
+      setattr(self, k, state[k])
+    # Share strings and memory maps with the entries of other logs
+    for k in self.interned:
+      setattr(self, k, sys.intern(getattr(self, k)))
+    self.memorymap = get_memory_map(self.memorymap)
+
+  ### Convert state of an entry from a pickle that predates the slots
+  # Such entries have the incantations as separate booleans and possibly a
+  # copy of the raw text with the fixed name (raw_fixed)
+  def convert_state(self, d):
+    n = dict()
+    n['raw'] = d['raw']
+    n['rawsrc'] = d.get('rawsrc')
+    n['rawspan'] = d.get('rawspan')
+    n['raw_fixed'] = d.get('raw_fixed', '')
+    for k in ['name', 'scopetree', 'memorymap', 'pos', 'neg', 'total',
+      'parent']:
+      n[k] = d[k]
+    n['short_name'] = d['short_name']
+    n['kind'] = d['kind']
+    n['st'] = d.get('st')
+    flags = 0
+    if d['general_bc']:
+      flags |= self.general_bc_bit
+    if d['mem_stress']:
+      flags |= self.mem_stress_bit
+    if d['rand_threads']:
+      flags |= self.rand_threads_bit
+    if d['barrier']:
+      flags |= self.barrier_bit
+    if d.get('fixed') or d.get('raw_fixed'):
+      flags |= self.fixed_bit
+    n['flags'] = flags
+    return n
+
   def __repr__(self):
     #return self
     return self.name
@@ -270,16 +1228,19 @@ class LogEntry:
     else:
       return 1
 
+  # The fields are interned, so they are usually equal by identity
   def check_const(self, e):
-    if self.name != e.name:
+    if self.name is not e.name and self.name != e.name:
       raise InconsistentTestsError('Name')
-    if self.short_name != e.short_name:
+    if self.short_name is not e.short_name and\
+      self.short_name != e.short_name:
       raise InconsistentTestsError('Short name')
-    if self.kind != e.kind:
+    if self.kind is not e.kind and self.kind != e.kind:
       raise InconsistentTestsError('Kind')
-    if self.scopetree.strip() != e.scopetree.strip():
+    if self.scopetree is not e.scopetree and\
+      self.scopetree.strip() != e.scopetree.strip():
       raise InconsistentTestsError('Scopetree')
-    if self.memorymap != e.memorymap:
+    if self.memorymap is not e.memorymap and self.memorymap != e.memorymap:
       raise InconsistentTestsError('Memorymap')
 
   def is_pos(self):
@@ -289,23 +1250,41 @@ class LogEntry:
   # Parsing - Extract fields #
   ############################
 
+  # Precompiled patterns for extracting fields from the lines of an entry
+  name_re = re.compile(
+    r'[ \t]*(GPU_PTX|RACE_OPENCL)[ \t]+(?P<name>[^\s]+)[ \t]*')
+  st_re = re.compile(r'\([ \t]*device')
+  mm_item = r'([a-zA-Z]+[ \t]*:[ \t]*(global|shared|local))'
+  mm_re = re.compile(mm_item + r'([ \t]*(,|;)[ \t]*' + mm_item + r')*')
+  nums_re = re.compile(r'[ \t]*[Pp]ositive:[ \t]*(?P<pos>[0-9]+)[ \t]*,?' +
+    r'[ \t]*[Nn]egative:[ \t]*(?P<negx>[0-9]+)[ \t]*')
+  mem_stress_re = re.compile(
+    r'/\*[ \t]*gpu_mem_stress[ \t]*:[ \t]*(?P<b>(true|false))')
+  general_bc_re = re.compile(
+    r'/\*[ \t]*gpu_general_bc[ \t]*:[ \t]*(?P<b>(true|false))')
+  barrier_re = re.compile(r'/\*[ \t]*barrier[ \t]*:[ \t]*(?P<b>(none|user))')
+  rand_threads_re = re.compile(
+    r'/\*[ \t]*gpu[_-]rand[_-]threads[ \t]*:[ \t]*(?P<b>(true|false))')
+  failure_re = re.compile(r'([Ff]ail)|([Aa]ssert)|([Ee]rror\:)')
+
   def get_name(self, s):
-    r = r'[ \t]*(GPU_PTX|RACE_OPENCL)[ \t]+(?P<name>[^\s]+)[ \t]*'
-    mo = re.fullmatch(r, s)
+    mo = self.name_re.fullmatch(s)
     if not mo:
       return False, ''
-    d = mo.groupdict()
-    return True, d['name']
+    return True, mo.group('name')
 
   def get_st(self, s):
-    mo = re.search(r'\([ \t]*device', s)
+    if 'device' not in s:
+      return False, ''
+    mo = self.st_re.search(s)
     if not mo:
       return False, ''
     return True, s.strip()
 
   def get_mm(self, s):
-    item = r'([a-zA-Z]+[ \t]*:[ \t]*(global|shared|local))'
-    mo = re.fullmatch(item + r'([ \t]*(,|;)[ \t]*' + item + r')*', s)
+    if ':' not in s:
+      return False, []
+    mo = self.mm_re.fullmatch(s)
     if not mo:
       return False, []
     trans = str.maketrans(',', ';')
@@ -325,89 +1304,70 @@ class LogEntry:
     return True, m
 
   def get_nums(self, s):
-    a = r'[ \t]*[Pp]ositive:[ \t]*(?P<pos>[0-9]+)[ \t]*,?'
-    b = r'[ \t]*[Nn]egative:[ \t]*(?P<negx>[0-9]+)[ \t]*'
-    mo = re.fullmatch(a + b, s)
+    if 'ositive' not in s:
+      return False, (0, 0)
+    mo = self.nums_re.fullmatch(s)
     if not mo:
       return False, (0, 0)
-    d = mo.groupdict()
-    return True, (int(d['pos']), int(d['negx']))
+    return True, (int(mo.group('pos')), int(mo.group('negx')))
 
   def get_mem_stress(self, s):
-    r = r'/\*[ \t]*gpu_mem_stress[ \t]*:[ \t]*(?P<b>(true|false))'
-    mo = re.search(r, s)
-    if not mo:
-      return False, False
-    d = mo.groupdict()
-    return True, 'true' in d['b']
+    return self.get_comment(self.mem_stress_re, s, 'true')
 
   def get_general_bc(self, s):
-    r = r'/\*[ \t]*gpu_general_bc[ \t]*:[ \t]*(?P<b>(true|false))'
-    mo = re.search(r, s)
-    if not mo:
-      return False, False
-    d = mo.groupdict()
-    return True, 'true' in d['b']
+    return self.get_comment(self.general_bc_re, s, 'true')
 
   def get_barrier(self, s):
-    r = r'/\*[ \t]*barrier[ \t]*:[ \t]*(?P<b>(none|user))'
-    mo = re.search(r, s)
-    if not mo:
-      return False, False
-    d = mo.groupdict()
-    return True, 'user' in d['b']
+    return self.get_comment(self.barrier_re, s, 'user')
 
   def get_rand_threads(self, s):
-    r = r'/\*[ \t]*gpu[_-]rand[_-]threads[ \t]*:[ \t]*(?P<b>(true|false))'
-    mo = re.search(r, s)
+    return self.get_comment(self.rand_threads_re, s, 'true')
+
+  # Incantation comment (e.g. /* gpu_mem_stress: true */)
+  def get_comment(self, r, s, on):
+    if '/*' not in s:
+      return False, False
+    mo = r.search(s)
     if not mo:
       return False, False
-    d = mo.groupdict()
-    return True, 'true' in d['b']
-
-  ### Collect items from string
-  # s: log as string
-  # fl: parsing function list
-  def collect(self, s, fl):
+    return True, on in mo.group('b')
+
+  # Fields in the order in which they appear in an entry; the first n_mandatory
+  # fields are required, the incantation comments are missing in older logs
+  fields = [('name', get_name), ('st', get_st), ('mm', get_mm),
+            ('nums', get_nums), ('barrier', get_barrier),
+            ('general_bc', get_general_bc), ('mem_stress', get_mem_stress),
+            ('rand_threads', get_rand_threads)]
+  n_mandatory = 4
+
+  ### Extract fields from log in a single pass over its lines
+  # Each line is only checked against the field that is expected next. The
+  # incantations are only taken into account if all of them were found.
+  def extract(self, s):
+    fl = self.fields
     le = len(fl)
-    key, f = fl[0]
-    lines = s.splitlines()
     i = 0
-    res = dict()
-    for l in lines:
-      r = f(l)
+    key, f = fl[0]
+    d = dict()
+    for l in s.splitlines():
+      r = f(self, l)
       if r[0]:
-        res[key] = r[1]
+        d[key] = r[1]
         i += 1
         if i == le:
           break
         key, f = fl[i]
-    lm = len(res)
-    if lm == le:
-      return res
-    return False
 
-  ### Extract fields from log
-  def extract(self, s):
-    fl1 = [('name', self.get_name), ('st', self.get_st), ('mm', self.get_mm),
-           ('nums', self.get_nums)]
-    fl2 = fl1 + [('barrier', self.get_barrier),
-                 ('general_bc', self.get_general_bc),
-                 ('mem_stress', self.get_mem_stress),
-                 ('rand_threads', self.get_rand_threads)]
-
-    try_list = [fl2, fl1]
-
-    for fl in try_list:
-      d = self.collect(s, fl)
-      if d:
-        break
-    else:
-      mo = re.search('([Ff]ail)|([Aa]ssert)|([Ee]rror\:)', s)
+    if i < self.n_mandatory:
+      mo = self.failure_re.search(s)
       if mo:
         raise FailureEntryError(s)
       raise InvalidEntryError(s)
-    
+
+    if i < le:
+      # Incomplete incantations (e.g. log without incantation comments)
+      d = dict((key, d[key]) for key, f in fl[:self.n_mandatory])
+
     return d
 
   ##################
@@ -420,14 +1380,13 @@ class LogEntry:
 
     d = self.extract(s)
 
-    name = d['name']
+    name = sys.intern(d['name'])
     self.name = name
     # Strip off suffix after '-'
-    self.short_name = self.get_short_name(name)
+    self.short_name = sys.intern(self.get_short_name(name))
     assert(len(self.name) >= len(self.short_name))
 
-    num = re.fullmatch('[0-9]{3}', name[-3:])
-    if num:
+    if is_numeric_name(name):
       raise NumericNameError(name)
 
     self.kind = name
@@ -435,12 +1394,9 @@ class LogEntry:
     self.raw = s
 
     st = d['st']
-    self.scopetree = st
-    # No parse actions necessary here, just a syntax check
-    def f(x): return x
-    p = self.get_st_parser([f, f, f ,f, f])
-    pr = p.parseString(st)
-    chk(pr, ErrMsg.logform)
+    self.scopetree = sys.intern(st)
+    # Also checks the syntax of the scope tree
+    self.st = get_scope_tree(st)
 
     nums = d['nums']
     self.pos = nums[0]
@@ -450,12 +1406,18 @@ class LogEntry:
     total = self.pos + self.neg
     self.total = total
 
-    self.memorymap = d['mm']
+    self.memorymap = get_memory_map(d['mm'])
 
-    self.general_bc = d.get('general_bc', False)
-    self.mem_stress = d.get('mem_stress', False)
-    self.rand_threads = d.get('rand_threads', False)
-    self.barrier = d.get('barrier', False)
+    flags = 0
+    if d.get('general_bc', False):
+      flags |= self.general_bc_bit
+    if d.get('mem_stress', False):
+      flags |= self.mem_stress_bit
+    if d.get('rand_threads', False):
+      flags |= self.rand_threads_bit
+    if d.get('barrier', False):
+      flags |= self.barrier_bit
+    self.flags = flags
 
   # For debugging
   def dump(self):
@@ -465,7 +1427,7 @@ class LogEntry:
     '  Short name: ' + self.short_name + '\n' +\
     '  Kind: ' + self.kind + '\n' +\
     '  Scope tree: ' + self.scopetree + '\n' +\
-    '  Memory map: ' + str(self.memorymap) + '\n' +\
+    '  Memory map: ' + str(list(self.memorymap)) + '\n' +\
     '  Positive: ' + str(self.pos) + '\n' +\
     '  Negative: ' + str(self.neg) + '\n' +\
     '  Total: ' + str(self.total) + '\n' +\
@@ -492,7 +1454,9 @@ class LogEntry:
     return s
 
   # Give test a wacky name for use as a key (and possibly strip off existing
-  # name suffixes); also fix raw litmus log (instance variable raw_fixed)
+  # name suffixes); also fix raw litmus log (raw_fixed) if the entry holds its
+  # raw text, otherwise the raw litmus log with the fixed name is produced on
+  # demand by get_raw_fixed()
   #
   # Example names to be fixed:
   # - 2+2W+membar.cta+membar.sys
@@ -508,22 +1472,64 @@ class LogEntry:
       chk(re.search('[Pp]0', name), 'test name contains dash (-) yet no p0')
       name = name[:idx]
     # Fix test name
-    self.short_name = name
+    self.short_name = sys.intern(name)
     name += '-' + self.ppi_scopetree_name() + '-' + self.ppi_memorymap_name()
-    self.name = name
+    self.name = sys.intern(name)
+    self.flags |= self.fixed_bit
+    if self.rawsrc:
+      return
     # Fix raw log
-    raw = self.raw
-
-    self.raw_fixed = raw
+    self.raw_fixed = self.sub_name(self.raw, name_orig, name)
+
+  # Raw litmus log of the entry
+  def get_raw(self):
+    if self.rawsrc:
+      return self.rawsrc.get(self.rawspan)
+    return self.raw
+
+  # Raw litmus log of the entry with the name produced by fix_name(), or the
+  # empty string if the name has not been fixed
+  def get_raw_fixed(self):
+    if self.raw_fixed or not self.is_fixed():
+      return self.raw_fixed
+    # The raw text is kept in the source log (e.g. memory-mapped); the original
+    # name is retained as kind
+    return self.sub_name(self.get_raw(), self.kind, self.name)
+
+  # Raw litmus log with the test name name_orig replaced by name
+  def sub_name(self, raw, name_orig, name):
+    raw_fixed = raw
     raw1 = re.sub(r'GPU_PTX\s+' + re.escape(name_orig), 'GPU_PTX ' +
       name, raw)
     if raw1 != raw:
-      self.raw_fixed = raw1
+      raw_fixed = raw1
     raw2 = re.sub(r'RACE_OPENCL\s+' + re.escape(name_orig), 'RACE_OPENCL ' +
       name, raw)
     if raw2 != raw:
-      self.raw_fixed = raw2
+      raw_fixed = raw2
     assert(raw == raw1 or raw == raw2)
+    return raw_fixed
+
+  # Drop raw litmus log (e.g. for entries of a sum log)
+  def drop_raw(self):
+    self.raw = ''
+    self.rawsrc = None
+    self.rawspan = None
+    self.raw_fixed = ''
+
+  # Entry of the same test with zero counts and without raw litmus log, for
+  # aggregating the counts of several entries (e.g. for a sum log); the other
+  # fields are immutable and hence shared with this entry
+  def get_aggregate(self, parent):
+    le = LogEntry.__new__(LogEntry)
+    for a in self.__slots__:
+      setattr(le, a, getattr(self, a))
+    le.drop_raw()
+    le.pos = 0
+    le.neg = 0
+    le.total = 0
+    le.parent = parent
+    return le
 
   def get_short_name(self, name):
     idx = name.find('-')
@@ -532,35 +1538,6 @@ class LogEntry:
       return name[:idx]
     return name
 
-  # Produce scope tree parser using a list of parse actions (can be used to e.g.
-  # translate a scope tree to a different format)
-  def get_st_parser(self, l):
-
-    # Tokens
-    d = pp.Suppress('device')
-    k = pp.Suppress('kernel')
-    c = pp.Suppress('cta')
-    w = pp.Suppress('warp')
-    t = pp.Regex('[Pp][0-9]+')
-    lp = pp.Suppress('(')
-    rp = pp.Suppress(')')
-
-    # Grammar
-    wn = lp + w + pp.OneOrMore(t) + rp
-    cn = lp + c + pp.OneOrMore(wn) + rp
-    kn = lp + k + pp.OneOrMore(cn) + rp
-    dn = lp + d + pp.OneOrMore(kn) + rp
-    st = pp.OneOrMore(dn)
-
-    # Parse actions
-    wn.setParseAction(l[0])
-    cn.setParseAction(l[1])
-    kn.setParseAction(l[2])
-    dn.setParseAction(l[3])
-    st.setParseAction(l[4])
-
-    return st
-
   # Example ID: gtx540-2+2W+membar.cta+membar.sys-p0:p1-xgyg.txt
   def get_id(self):
     assert(self.parent)
@@ -577,13 +1554,13 @@ class LogEntry:
     if not fn:
       fn = 'entries/' + self.get_id() + '.txt'
     f = open(fn, 'w')
-    f.write(self.raw)
+    f.write(self.get_raw())
     f.close()
 
   def store_log_dir(self, di):
     fn = di + '/' + self.get_id() + '.txt'
     f = open(fn, 'w')
-    f.write(self.raw)
+    f.write(self.get_raw())
     f.close()  
 
   #####################
@@ -605,76 +1582,76 @@ class LogEntry:
   def is_mixed_mem(self):
     return not (self.is_global() or self.is_shared())
 
+  # Memory class (0 for mixed memory)
+  def get_mem(self):
+    return (self.mem_global_bit if self.is_global() else 0) |\
+      (self.mem_shared_bit if self.is_shared() else 0)
+
   ####################
   # Scope predicates #
   ####################
 
+  # Scope tree object (shared with other entries with the same scope tree)
+  def get_st(self):
+    if not self.st:
+      self.st = get_scope_tree(self.scopetree)
+    return self.st
+
   # s-warp
   def is_thread(self):
-    l = [f2, f1, f1, f1, f1]
-    p = self.get_st_parser(l)
-    pr = p.parseString(self.scopetree)
-    return bool(pr[0])
+    return self.get_st().scope == Scope.thread
 
   # d-warp:s-cta
   def is_warp(self):
-    l = [f1, f2, f1, f1, f1]
-    p = self.get_st_parser(l)
-    pr = p.parseString(self.scopetree)
-    return bool(pr[0])
+    return self.get_st().scope == Scope.warp
 
   # d-cta:s-ker
   def is_cta(self):
-    l = [f1, f1, f2, f1, f1]
-    p = self.get_st_parser(l)
-    pr = p.parseString(self.scopetree)
-    return bool(pr[0])
+    return self.get_st().scope == Scope.cta
 
   # d-ker:s-dev
   def is_ker(self):
-    l = [f1, f1, f1, f2, f1]
-    p = self.get_st_parser(l)
-    pr = p.parseString(self.scopetree)
-    return bool(pr[0])
+    return self.get_st().scope == Scope.ker
 
   # d-dev
   def is_dev(self):
-    l = [f1, f1, f1, f1, f2]
-    p = self.get_st_parser(l)
-    pr = p.parseString(self.scopetree)
-    return bool(pr[0])
+    return self.get_st().scope == Scope.dev
 
   # mixed
   def is_mixed_scope(self):
-    return not (self.is_thread() or self.is_warp() or self.is_cta() or
-      self.is_ker() or self.is_dev())
+    return self.get_st().scope == Scope.mixed
 
   ##########################
   # Incantation predicates #
   ##########################
 
   def is_general_bc(self):
-    return self.general_bc
+    return bool(self.flags & self.general_bc_bit)
 
   def is_mem_stress(self):
-    return self.mem_stress
+    return bool(self.flags & self.mem_stress_bit)
 
   def is_rand_threads(self):
-    return self.rand_threads
+    return bool(self.flags & self.rand_threads_bit)
 
   def is_barrier(self):
-    return self.barrier
+    return bool(self.flags & self.barrier_bit)
+
+  # Incantations (see *_bit above)
+  def get_incantations(self):
+    return self.flags & self.incantation_bits
 
   ####################
   # Other predicates #
   ####################
 
+  # Whether fix_name() has been applied
+  def is_fixed(self):
+    return bool(self.flags & self.fixed_bit)
+
   def does_match(self, rl):
     assert(lty(rl, str))
-    for r in rl:
-      if re.match(r, self.name):
-        return True
-    return False
+    return get_key_matcher([rl]).classify(self.name) == 0
 
   # Match against the short name (without scope tree and memory map designator)
   def simple_match(self, s):
@@ -706,29 +1683,13 @@ class LogEntry:
       s += el[0] + self.mem_norm[el[1]]
     return s
 
-  # pp for name as key
-  def ppi_thread_name(self, t):
-    assert(re.fullmatch('[Pp][0-9]', t))
-    return 'p' + t[1]
-
   # pp for name as key
   def ppi_scopetree_name(self):
-    l = [
-      lambda tokens: "".join(map(self.ppi_thread_name, tokens)),
-      lambda tokens: ":".join(tokens),
-      lambda tokens: "::".join(tokens),
-      lambda tokens: ":::".join(tokens),
-      lambda tokens: "::::".join(tokens)
-    ]
-    p = self.get_st_parser(l)
-    pr = p.parseString(self.scopetree)
-    assert(len(pr) == 1)
-    assert(type(pr[0]) is str)
-    return pr[0]
+    return self.get_st().name
 
   def ppi_incantations(self):
-    return str(int(self.mem_stress)) + str(int(self.general_bc)) +\
-      str(int(self.barrier)) + str(int(self.rand_threads))
+    return str(int(self.is_mem_stress())) + str(int(self.is_general_bc())) +\
+      str(int(self.is_barrier())) + str(int(self.is_rand_threads()))
 
   def ppi_num(self):
     assert(self.total == self.pos + self.neg)
@@ -778,24 +1739,8 @@ class LogEntry:
   def pp_memorymap(self):
     return self.ppi_memorymap()
 
-  def pp_thread(self, t):
-    assert(re.fullmatch('[Pp][0-9]', t))
-    return t[0] + '<sub>' + t[1] + '</sub>'
-
   def pp_scopetree(self):
-    # Convert to other scopetree representation
-    l = [
-      lambda tokens: " ".join(map(self.pp_thread, tokens)),
-      lambda tokens: " |<sub>warp</sub> ".join(tokens),
-      lambda tokens: " |<sub>cta</sub> ".join(tokens),
-      lambda tokens: " |<sub>ker</sub> ".join(tokens),
-      lambda tokens: " |<sub>dev</sub> ".join(tokens)
-    ]
-    p = self.get_st_parser(l)
-    pr = p.parseString(self.scopetree)
-    assert(len(pr) == 1)
-    assert(type(pr[0] == str))
-    return pr[0]
+    return self.get_st().html
 
   #########################
   # LaTeX pretty printers #
@@ -805,24 +1750,208 @@ class LogEntry:
     s = '& ' + self.pp_num()
     return s
 
-  def ppl_thread(self, t):
-    assert(re.fullmatch('[Pp][0-9]', t))
-    return t[0] + '_{' + t[1] + '}'
-
   def ppl_scopetree(self):
-    # Convert to other scopetree representation
-    l = [
-      lambda tokens: " ".join(map(self.pp_thread, tokens)),
-      lambda tokens: " |_{warp} ".join(tokens),
-      lambda tokens: " |_{cta} ".join(tokens),
-      lambda tokens: " |_{ker} ".join(tokens),
-      lambda tokens: " |_{dev} ".join(tokens)
-    ]
-    p = self.get_st_parser(l)
-    pr = p.parseString(self.scopetree)
-    assert(len(pr) == 1)
-    assert(type(pr[0] == str))
-    return pr[0]
+    return self.get_st().latex
+
+# Numeric fields of a log entry, as read from a log store without the rest of
+# the entry (see load_store_fields()); provides the predicates and printers of
+# LogEntry that only need them
+class EntryCounts(collections.namedtuple('EntryCounts',
+  ['pos', 'neg', 'total', 'flags'])):
+  """Counts of a log entry"""
+
+  __slots__ = ()
+
+  is_pos = LogEntry.is_pos
+  ppi_num = LogEntry.ppi_num
+
+# ------------------------------------------------------------------------------
+# Splitting a textual litmus log into entries
+
+# Tag starting the first line of an entry
+entry_tag = re.compile('GPU_PTX|RACE_OPENCL')
+
+# Header of an entry (appears at the end of the text of the previous entry)
+entry_header = re.compile(r"([ \t]*%+[ \t]*\n" +\
+  r"[ \t]*%+.+?%+[ \t]*\n" +\
+  r"[ \t]*%+[ \t]*)")
+
+### Turn the text between two entry tags into an entry
+# s: text starting at a tag line and ending before the newline that precedes the
+#    next tag line (or at the end of the log)
+# first: whether s is the text at the very beginning of the log
+# Returns: entry as string, or None if s is not an entry (e.g. a preamble)
+def assemble_entry(s, first):
+  mo = entry_tag.match(s)
+  if first:
+    if not mo:
+      return None
+    return entry_header.sub("", s)
+  assert(mo)
+  tag = mo.group(0)
+  return tag + entry_header.sub("", s[len(tag):]) + '\n'
+
+### Yield the entries of a textual litmus log one at a time
+# lines: iterable of lines including line endings (e.g. a file object); only
+#        the lines of the current entry are held in memory
+def read_entries(lines):
+  chunk = []
+  first = True
+  for line in lines:
+    if chunk and entry_tag.match(line):
+      s = ''.join(chunk)
+      # Drop newline preceding the tag
+      assert(s[-1] == '\n')
+      es = assemble_entry(s[:-1], first)
+      if es != None:
+        yield es
+      chunk = []
+      first = False
+    chunk.append(line)
+  if chunk:
+    es = assemble_entry(''.join(chunk), first)
+    if es != None:
+      yield es
+
+# Tag starting an entry, and newline followed by such a tag (in the bytes of a
+# log)
+entry_tag_b = re.compile(b'GPU_PTX|RACE_OPENCL')
+entry_sep = re.compile(b'\n(GPU_PTX|RACE_OPENCL)')
+
+### Yield the spans (offset, length) of the entries in the bytes of a log
+# b: bytes-like object (e.g. memory-mapped file)
+# start: offset of an entry at which to start (see last_entry())
+# The spans are the same as the texts passed to assemble_entry() by
+# read_entries() (a span at offset 0 is the beginning of the log)
+def scan_entries(b, start=0):
+  # The text before the first tag is only an entry if the log starts with a tag
+  first = start == 0 and entry_tag_b.match(b)
+  off = start
+  for mo in entry_sep.finditer(b, start):
+    end = mo.start()
+    # Line ending \r\n
+    if end > off and b[end-1:end] == b'\r':
+      end -= 1
+    if off != 0 or first:
+      yield off, end - off
+    off = mo.start() + 1
+  if off != 0 or first:
+    yield off, len(b) - off
+
+### Offset of the last entry in the bytes of a log (0 if there is only one)
+def last_entry(b):
+  i = max(b.rfind(b'\nGPU_PTX'), b.rfind(b'\nRACE_OPENCL'))
+  return i + 1
+
+# File holding the raw texts of log entries, which are read on demand
+class RawFile:
+  """Memory-mapped file of raw log entries"""
+
+  # fn: filename (may be set later)
+  # size: expected size of the file (checked on first use), or None
+  def __init__(self, fn, size=None):
+    self.fn = fn
+    self.size = size
+    self.mm = None
+
+  # Only the filename is pickled (or copied); the file is mapped again on first
+  # use
+  def __getstate__(self):
+    return {'fn': self.fn, 'size': self.size, 'mm': None}
+
+  # fo: the file opened in binary mode (or None), to map it from on first use
+  def get_buffer(self, fo=None):
+    if self.mm == None:
+      assert(self.fn)
+      f = fo if fo else open(self.fn, 'rb')
+      n = os.fstat(f.fileno()).st_size
+      chk(self.size == None or n == self.size, 'file ' + self.fn +\
+        ' does not match the log it belongs to')
+      if n == 0:
+        self.mm = b''
+      else:
+        self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      if not fo:
+        f.close()
+    return self.mm
+
+  # Text at span (offset, length)
+  def get(self, span):
+    off, n = span
+    return self.get_buffer()[off:off+n].decode()
+
+# Textual litmus log from which the raw text of entries is read on demand
+class LogSource(RawFile):
+  """Memory-mapped textual litmus log"""
+
+  # fo: file fn opened in binary mode (or None), from which it is then mapped
+  def __init__(self, fn, fo=None):
+    # Absolute path such that the entries can be read from anywhere
+    RawFile.__init__(self, os.path.abspath(fn))
+    if fo:
+      self.get_buffer(fo)
+
+  # Entry at span (as returned by scan_entries())
+  def get(self, span):
+    off, n = span
+    s = RawFile.get(self, span)
+    s = s.replace('\r\n', '\n').replace('\r', '\n')
+    return assemble_entry(s, off == 0)
+
+  # Yield pairs of entry and span, starting at the entry at offset start
+  def entries(self, start=0):
+    for span in scan_entries(self.get_buffer(), start):
+      yield self.get(span), span
+
+# Original numeric name of a test (e.g. *003)
+def is_numeric_name(name):
+  return re.fullmatch('[0-9]{3}', name[-3:]) != None
+
+### Check whether entry is a failed test (without parsing it)
+# Returns: True only if parsing the entry would throw FailureEntryError (a
+#   failure marker is present, and there is no line with the numbers of
+#   positive and negative outcomes)
+def entry_failed(es):
+  # Substrings of the failure markers, found much faster than with the regular
+  # expression (most entries have none of them)
+  if not ('ail' in es or 'ssert' in es or 'rror:' in es):
+    return False
+  if not LogEntry.failure_re.search(es):
+    return False
+  if 'ositive' not in es:
+    return True
+  for l in es.splitlines():
+    if 'ositive' in l and LogEntry.nums_re.fullmatch(l):
+      return False
+  return True
+
+### Parse a single entry (possibly in a worker process)
+# a: tuple of entry string, log name, whether to fix the name of the test, and
+#    span of the entry in the source log (or None)
+# Entries of failed tests are recognized from their failure markers before
+# parsing them (tests with numeric names and duplicates are only dropped once
+# the entry has been parsed, such that malformed entries are reported)
+# Returns: log entry, or the exception that occurred during parsing (a worker
+#   must neither throw these nor exit); the raw text is not retained in the
+#   entry if a span is given
+def parse_entry(a):
+  es, fn, fix_names, span = a
+  try:
+    assert(25 < len(es) < 5000)
+    if entry_failed(es):
+      return FailureEntryError(es)
+    le = LogEntry(es, fn)
+    if fix_names:
+      le.fix_name()
+  except (FailureEntryError, InvalidEntryError, NumericNameError,
+    SystemExit) as e:
+    return e
+  if span:
+    # The raw text (also with the fixed name) is read from the source log
+    le.raw = ''
+    le.raw_fixed = ''
+    le.rawspan = span
+  return le
 
 # ------------------------------------------------------------------------------
 # Full logs (collection of valid log entries)
@@ -831,10 +1960,19 @@ class LogEntry:
 class Log:
   """Litmus log"""
 
+  # Default for logs unpickled from older pickles
+  checkpoint = None
+  entry_index = None
+
   def __init__(self):
     self.d = collections.OrderedDict()
     # Filename of the log from which it was created (e.g. gtx660.txt)
     self.fn = ''
+    # Part of the textual log that has been parsed (see from_source())
+    self.checkpoint = None
+    # Secondary index of the entries (see LogInc.get_entry_index()), dropped
+    # when the log is changed
+    self.entry_index = None
 
   ########
   # Base #
@@ -862,19 +2000,41 @@ class Log:
     key = le.name
     assert(not(self.get(key)))
     self.d[key] = le
+    self.entry_index = None
 
   def fix(self):
     d = collections.OrderedDict()
     for key, val in self.d.items():
       # Fix test name and name in raw log (raw_fixed)
       val.fix_name()
-      assert(val.raw_fixed)
+      assert(val.is_fixed())
       key = self.get_key(val)
       d[key] = val
     self.d = d
+    self.entry_index = None
 
   def sort(self):
     self.d = collections.OrderedDict(sorted(self.d.items()))
+    self.entry_index = None
+
+  # Log of the entries that satisfy the filter (the entries are shared)
+  def select(self, filt):
+    log = type(self)()
+    log.fn = self.fn
+    for key, val in self.d.items():
+      if filt(val):
+        log.d[key] = val
+    return log
+
+  # Log of the entries with the given keys (the entries are shared)
+  # ks: set of keys
+  def restrict(self, ks):
+    log = type(self)()
+    log.fn = self.fn
+    for key, val in self.d.items():
+      if key in ks:
+        log.d[key] = val
+    return log
 
   # Verify key to entry mapping
   def verify(self):
@@ -893,61 +2053,141 @@ class Log:
 
   ### Read log from string
   # s: string representing the whole log
-  def from_string(self, s, fix_names, drop_dups, drop_numeric):
+  # jobs: number of processes to use for parsing the entries
+  def from_string(self, s, fix_names, drop_dups, drop_numeric, jobs=1):
     assert(not self.d)
     assert(self.fn)
 
     if not s:
       return
 
-    # Split log
-    tag = 'GPU_PTX|RACE_OPENCL'
-    header = r"([ \t]*%+[ \t]*\n" +\
-      r"[ \t]*%+.+?%+[ \t]*\n" +\
-      r"[ \t]*%+[ \t]*)"
-    l = re.split('\n(' + tag + ')', s)
-    # Reassemble
-    if not l[0]:
-      l = l[1:]
-      assert(l[0] == tag)
-    pre = []
-    if l[0] != tag:
-      if re.match(tag, l[0]):
-        pre = [re.sub(header, "", l[0])]
-      l = l[1:]
-    n = len(l)
-    chk(n % 2 == 0, ErrMsg.logform)
-    rl = list()
-    for i in range(0, n, 2):
-      assert(re.fullmatch(tag, l[i]))
-      el = re.sub(header, "", l[i+1])
-      el = l[i] + el + '\n'
-      rl.append(el)
-    rl = pre + rl
-
-    # Parse and enter into dict
+    f = io.StringIO(s)
+    rl = ((es, None) for es in read_entries(f))
+    self.from_entries(rl, fix_names, drop_dups, drop_numeric, jobs)
+
+  ### Read log from file
+  # The file may be compressed (gzip, bz2, or xz), it is then decompressed while
+  # the entries are parsed
+  # mapped: memory-map the file, and keep only the spans of the entries in the
+  #   file rather than their text (see LogSource); ignored for compressed files
+  # fo: binary stream of the text of the log at its start, i.e. file fn opened
+  #   in binary mode, or a stream decompressing it (mapped must then be False);
+  #   or None to open (and possibly decompress) fn. The stream is not closed.
+  def from_file(self, fn, fix_names, drop_dups, drop_numeric, jobs=1,
+    mapped=False, fo=None):
+    assert(not self.d)
+    self.fn = fn
+    if not fo:
+      fo, fmt = open_log(fn)
+      try:
+        codec = log_codecs.get(fmt)
+        if codec:
+          c = codec.open(fo)
+          self.from_file(fn, fix_names, drop_dups, drop_numeric, jobs, False, c)
+          c.close()
+        else:
+          self.from_file(fn, fix_names, drop_dups, drop_numeric, jobs, mapped,
+            fo)
+      finally:
+        fo.close()
+      return
+    if mapped:
+      src = LogSource(fn, fo)
+      self.from_entries(src.entries(), fix_names, drop_dups, drop_numeric,
+        jobs, src)
+      return
+    f = io.TextIOWrapper(fo)
+    rl = ((es, None) for es in read_entries(f))
+    self.from_entries(rl, fix_names, drop_dups, drop_numeric, jobs)
+    # Leave the stream open for the caller
+    f.detach()
+
+  ### Read log from memory-mapped textual log, possibly continuing an earlier
+  # read of a prefix of it
+  # src: LogSource
+  # checkpoint: pair of offset and number of entries from the checkpoint of the
+  #   earlier read (the log then holds the entries of that read), or None
+  # Sets self.checkpoint to the offset of the last entry of src, the number of
+  # entries in the log before that entry, and the sha256 hash of the bytes
+  # before it. The last entry is parsed again when continuing from the
+  # checkpoint, as the text appended to the log up to the next entry belongs to
+  # it. If the last entry is invalid, it is skipped rather than reported as the
+  # log may end within it (e.g. as it is still being written).
+  def from_source(self, src, fix_names, drop_dups, drop_numeric, jobs=1,
+    mapped=False, checkpoint=None):
+    assert(self.fn)
+    start = 0
+    if checkpoint:
+      start, count = checkpoint
+      assert(count <= len(self.d))
+      self.d = collections.OrderedDict(list(self.d.items())[:count])
+    else:
+      assert(not self.d)
+    count = len(self.d)
+
+    b = src.get_buffer()
+    offset = last_entry(b)
+    rl = src.entries(start)
+    if offset >= start and entry_tag_b.match(b, offset):
+      es = src.get((offset, len(b) - offset))
+      if len(es) <= 25 or type(parse_entry((es, self.fn, fix_names,
+        None))) == InvalidEntryError:
+        print('skipped incomplete last entry at byte ' + str(offset))
+        rl = ((es, span) for es, span in rl if span[0] != offset)
+    self.from_entries(rl, fix_names, drop_dups, drop_numeric, jobs, src)
+
+    les = list(self.d.values())[count:]
+    if les and les[-1].rawspan[0] == offset:
+      n = len(self.d) - 1
+    else:
+      n = len(self.d)
+    digest = hashlib.sha256(memoryview(b)[:offset]).hexdigest()
+    self.checkpoint = (offset, n, digest)
+
+    if not mapped:
+      for le in les:
+        le.raw = le.get_raw()
+        le.rawsrc = None
+        le.rawspan = None
+
+  ### Parse entries and enter them into the log (after those already in it)
+  # rl: iterable of pairs of a string representing one log entry and its span
+  #   in src (or None)
+  # jobs: number of processes to use for parsing the entries; the results are
+  #   entered in the order of rl in any case
+  # src: LogSource the entries are read from (or None)
+  def from_entries(self, rl, fix_names, drop_dups, drop_numeric, jobs=1,
+    src=None):
+    assert(self.fn)
+    assert(jobs >= 1)
+
+    al = ((es, self.fn, fix_names, span) for es, span in rl)
+    if jobs == 1:
+      pl = map(parse_entry, al)
+    else:
+      p = multiprocessing.Pool(jobs)
+      pl = p.imap(parse_entry, al, chunksize=256)
+
+    # Enter into dict
     dups = 0
     numeric_dropped = 0
     failed_dropped = 0
-    for es in rl:
-      try:
-        assert(25 < len(es) < 5000)
-        le = LogEntry(es, self.fn)
-      except FailureEntryError as e:
+    for le in pl:
+      if type(le) == FailureEntryError:
         failed_dropped += 1
         continue
-      except InvalidEntryError as e:
-        print(e)
+      elif type(le) == InvalidEntryError:
+        print(le)
         bail('invalid entry in litmus log')
-      except NumericNameError as e:
+      elif type(le) == NumericNameError:
         if drop_numeric:
           numeric_dropped += 1    
           continue
         else:
-          bail('test with original numeric name: ' + str(e))
-
-      if fix_names:
-        le.fix_name()
+          bail('test with original numeric name: ' + str(le))
+      elif type(le) == SystemExit:
+        # Error message has already been printed
+        sys.exit(le.code)
 
       key = self.get_key(le)
       if key in self.d:
@@ -956,7 +2196,14 @@ class Log:
           continue
         else:
           bail('duplicate key: ' + key)
+      if src:
+        le.rawsrc = src
       self.d[key] = le
+    self.entry_index = None
+
+    if jobs != 1:
+      p.close()
+      p.join()
 
     # Statistics about parsing/log
     print('dropped ' + str(dups) + ' duplicate tests')
@@ -964,14 +2211,6 @@ class Log:
     print('dropped ' + str(failed_dropped) + ' tests that failed')
     print('read ' + str(len(self.d)) + ' unique, successful tests')
 
-  def from_file(self, fn, fix_names, drop_dups, drop_numeric):
-    assert(not self.d)
-    f = open(fn, 'r')
-    s = f.read()
-    f.close()
-    self.fn = fn
-    self.from_string(s, fix_names, drop_dups, drop_numeric)
-
   # Dump internal representation of log (for debugging purposes)
   def dump(self, f=sys.stdout):
     s = 'Log name: ' + self.fn + '\n'
@@ -983,26 +2222,24 @@ class Log:
     f.write(s)
     f.close()
 
-  # Dump raw log
+  # Dump raw log (written entry by entry)
   def dump_raw(self, f=sys.stdout):
-    s = ''
-    for key, val in self.d.items():
-      assert(val.raw)
-      s += val.raw
     if type(f) == str:
       f = open(f, 'w')
-    f.write(s)
+    for key, val in self.d.items():
+      raw = val.get_raw()
+      assert(raw)
+      f.write(raw)
     f.close()
 
-  # Dump raw log with fixed names
+  # Dump raw log with fixed names (written entry by entry)
   def dump_raw_fixed(self, f=sys.stdout):
-    s = ''
-    for key, val in self.d.items():
-      assert(val.raw_fixed)
-      s += val.raw_fixed
     if type(f) == str:
       f = open(f, 'w')
-    f.write(s)
+    for key, val in self.d.items():
+      raw_fixed = val.get_raw_fixed()
+      assert(raw_fixed)
+      f.write(raw_fixed)
     f.close()
 
 # Log (explicit incantations)
@@ -1010,13 +2247,43 @@ class LogInc(Log):
 
   def get_key(self, le):
     key = le.name
-    inc1 = str(le.general_bc)
-    inc2 = str(le.mem_stress)
-    inc3 = str(le.rand_threads)
-    inc4 = str(le.barrier)
+    inc1 = str(le.is_general_bc())
+    inc2 = str(le.is_mem_stress())
+    inc3 = str(le.is_rand_threads())
+    inc4 = str(le.is_barrier())
     assert(key)
     return '-'.join([key, inc1, inc2, inc3, inc4])
 
+  ### Index of the entries by short name (lower case), scope class, memory,
+  # and incantations (see LogEntry.get_incantations()), also with incantations
+  # None for entries with any incantations; built on first use. An entry is
+  # indexed under each of mem_global_bit and mem_shared_bit that its memory
+  # class has (see LogEntry.get_mem()), or under 0 for mixed memory.
+  # Returns: dict mapping (short name, scope, mem, incantations) to the list of
+  #   entries (in log order)
+  def get_entry_index(self):
+    if self.entry_index == None:
+      d = dict()
+      for e in self.d.values():
+        t = e.short_name.lower()
+        scope = e.get_st().scope
+        m = e.get_mem()
+        ms = [b for b in [LogEntry.mem_global_bit, LogEntry.mem_shared_bit]
+          if m & b] or [0]
+        for mem in ms:
+          for incs in [e.get_incantations(), None]:
+            d.setdefault((t, scope, mem, incs), []).append(e)
+      self.entry_index = d
+    return self.entry_index
+
+  ### Get entries with short name (case-insensitive, see
+  # LogEntry.simple_match()) and scope class in memory mem (see
+  # get_entry_index()), in log order
+  # incs: incantations, or None for entries with any incantations
+  def lookup(self, short_name, scope, mem, incs=None):
+    return self.get_entry_index().get((short_name.lower(), scope, mem, incs),
+      [])
+
   # Get all unique short test names
   def get_names(self):
     short_names = [x.short_name for x in self.d.values()]
@@ -1032,3 +2299,68 @@ class LogInc(Log):
       mapped = self.get_key(val)
       assert(key == mapped)
 
+
+# ------------------------------------------------------------------------------
+# Aligned logs
+
+# Several logs aligned by key. The union of the keys, which logs have which
+# keys, and the first log that has a key are computed once on creation, so
+# that going over the keys of the logs needs no further lookups of keys in
+# logs that do not have them. The logs must not be changed while in use.
+class LogSet:
+  """Logs aligned by key"""
+
+  def __init__(self, logs):
+    self.logs = listify(logs)
+    assert(lins(self.logs, Log))
+    # Sorted union of the keys of the logs
+    self.keys = get_keys(self.logs)
+    # Position of a key in keys
+    self.index = dict(zip(self.keys, range(len(self.keys))))
+    n = len(self.keys)
+    # Presence map per log (byte i is 1 if the log has the i-th key)
+    self.present = []
+    # Per key, position of the first log that has it
+    self.owner = [-1] * n
+    for j, log in enumerate(self.logs):
+      p = bytearray(n)
+      for k in log.get_keys():
+        i = self.index[k]
+        p[i] = 1
+        if self.owner[i] < 0:
+          self.owner[i] = j
+      self.present.append(p)
+
+  def __len__(self):
+    return len(self.logs)
+
+  def get_keys(self):
+    return list(self.keys)
+
+  ### Get entry from first log that has key
+  def get_entry(self, k):
+    j = self.owner[self.index[k]]
+    return self.logs[j].d[k]
+
+  ### Get entries of all logs for key (None for logs that do not have it)
+  def get_entries(self, k):
+    i = self.index[k]
+    return [log.d[k] if p[i] else None
+      for log, p in zip(self.logs, self.present)]
+
+  # Check whether the j-th log has the key
+  def has_key(self, j, k):
+    i = self.index.get(k)
+    return i != None and self.present[j][i] == 1
+
+  ### Get logs that contain any of the given keys (in order)
+  def get_logs_with_keys(self, ks):
+    l = [self.index[k] for k in ks if k in self.index]
+    return [log for log, p in zip(self.logs, self.present)
+      if any(p[i] for i in l)]
+
+### Get aligned logs (logs may already be a LogSet)
+def get_log_set(logs):
+  if isinstance(logs, LogSet):
+    return logs
+  return LogSet(logs)
@@ -27,11 +27,11 @@ for f in $R/turks*.sed $R/tahiti*.sed
 do
   if [ ! -f $f.norm ]; then
     $l2l normalize -i $f.norm $f
-    $l2l pickle -i $f.pkl $f.norm
+    $l2l store -i $f.pkl $f.norm
     continue
   fi
   if [ ! -f $f.pkl ]; then
-    $l2l pickle -i $f.pkl $f.norm
+    $l2l store -i $f.pkl $f.norm
   fi
 done
 
@@ -48,11 +48,11 @@ for f in $R/GTX*.sed $R/Tesla*.sed
 do
   if [ ! -f $f.norm ]; then
     $l2l normalize $f.norm $f
-    $l2l pickle $f.pkl $f.norm
+    $l2l store $f.pkl $f.norm
     continue
   fi
   if [ ! -f $f.pkl ]; then
-    $l2l pickle $f.pkl $f.norm
+    $l2l store $f.pkl $f.norm
   fi
 done
 
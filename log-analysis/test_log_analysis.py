@@ -0,0 +1,643 @@
+import argparse
+import os
+import pytest
+import machinery as ma
+import filters as fi
+import columns as co
+import log2log
+import log2tbl
+import aggregate as ag
+
+# ------------------------------------------------------------------------------
+# Test logs
+
+# Scope trees by scope class
+sts = {
+  'warp': '(device (kernel (cta (warp P0) (warp P1))))',
+  'cta': '(device (kernel (cta (warp P0)) (cta (warp P1))))',
+  'dev': '(device (kernel (cta (warp P0)))) (device (kernel (cta (warp P1))))'
+}
+
+# Memory maps by memory class
+mms = {
+  'global': 'x: global, y: global',
+  'shared': 'x: shared; y: shared',
+  'mixed': 'x: global, y: shared'
+}
+
+### Text of a log entry
+# incs: values of the incantation comments (barrier, general_bc, mem_stress,
+#   rand_threads), or None for an entry without them
+def entry(name, scope, mem, pos, neg, incs=None):
+  s = 'GPU_PTX ' + name + '\n' +\
+    '"Some comment"\n' +\
+    '{\n0:.reg .s32 r0;\n}\n' +\
+    ' P0 | P1 ;\n' +\
+    ' ld r0,[x] | st [y],1 ;\n' +\
+    'ScopeTree\n' +\
+    sts[scope] + '\n' +\
+    mms[mem] + '\n' +\
+    'exists (0:r0=1)\n' +\
+    'Generated assembler\n' +\
+    'Witnesses\n' +\
+    'Positive: ' + str(pos) + ', Negative: ' + str(neg) + '\n' +\
+    'Observation ' + name + ' Sometimes ' + str(pos) + ' ' + str(neg) + '\n'
+  if incs:
+    barrier, general_bc, mem_stress, rand_threads = incs
+    s += '/* barrier: ' + ('user' if barrier else 'none') + ' */\n' +\
+      '/* gpu_general_bc: ' + str(general_bc).lower() + ' */\n' +\
+      '/* gpu_mem_stress: ' + str(mem_stress).lower() + ' */\n' +\
+      '/* gpu_rand_threads: ' + str(rand_threads).lower() + ' */\n'
+  s += 'Time ' + name + ' 0.5\n\n'
+  return s
+
+### Write textual log of the entries (see entry()) and read it
+def text_log(tmp_path, fn, es, lh=ma.Log):
+  f = str(tmp_path / fn)
+  with open(f, 'w') as fo:
+    fo.write(''.join(entry(*e) for e in es))
+  log = lh()
+  log.from_file(f, False, False, False)
+  return log
+
+# Fields of an entry that are kept in a log store
+def fields(le):
+  return (le.name, le.short_name, le.kind, le.scopetree, le.memorymap,
+    le.pos, type(le.pos), le.neg, type(le.neg), le.total, type(le.total),
+    le.flags, le.parent, le.get_raw(), le.get_st())
+
+def log_fields(log):
+  return [(k, fields(le)) for k, le in log.d.items()]
+
+entries1 = [
+  ('MP+membar.cta', 'warp', 'global', 10, 990),
+  ('SB', 'cta', 'shared', 0, 1000),
+  ('IRIW+membar.gl', 'dev', 'mixed', 3, 97),
+  ('LB', 'warp', 'shared', 1, 9),
+  ('WRC', 'cta', 'global', 5, 5)
+]
+
+entries_inc = [
+  ('MP', 'warp', 'global', 10, 990, (False, False, True, False)),
+  ('MP', 'warp', 'global', 20, 980, (True, False, True, True)),
+  ('SB', 'cta', 'global', 0, 1000, (False, True, False, False))
+]
+
+# ------------------------------------------------------------------------------
+# Log stores
+
+def test_store_round_trip(tmp_path):
+  log = text_log(tmp_path, 'a.txt', entries1)
+  f = str(tmp_path / 'a.log')
+  ma.write_store(log, f)
+  log2 = ma.load_store(f)
+  assert(type(log2) == ma.Log)
+  assert(log2.fn == log.fn)
+  # The entries are in log order
+  assert(log_fields(log2) == log_fields(log))
+
+def test_store_round_trip_inc(tmp_path):
+  log = text_log(tmp_path, 'inc.txt', entries_inc, ma.LogInc)
+  f = str(tmp_path / 'inc.log')
+  ma.write_store(log, f)
+  log2 = ma.get_logs(f, ma.LogInc)[0]
+  assert(type(log2) == ma.LogInc)
+  assert(log_fields(log2) == log_fields(log))
+  assert([le.get_incantations() for le in log2.get_all()] ==
+    [le.get_incantations() for le in log.get_all()])
+
+def test_store_float_counts(tmp_path):
+  log = text_log(tmp_path, 'a.txt', entries1)
+  for le in log.get_all():
+    le.pos = le.pos / 3
+    le.drop_raw()
+  f = str(tmp_path / 'a.log')
+  ma.write_store(log, f)
+  assert(log_fields(ma.load_store(f)) == log_fields(log))
+
+# Integer counts beyond the precision of doubles
+def test_store_large_counts(tmp_path):
+  log = text_log(tmp_path, 'a.txt', entries1)
+  for le in log.get_all():
+    le.pos = 2**53 + 1
+    le.neg = 2**62 + 3
+    le.total = le.pos + le.neg
+  f = str(tmp_path / 'a.log')
+  ma.write_store(log, f)
+  assert(log_fields(ma.load_store(f)) == log_fields(log))
+
+@pytest.mark.parametrize('es, lh', [(entries1, ma.Log),
+  (entries_inc, ma.LogInc)])
+def test_store_keys_fields(tmp_path, es, lh):
+  log = text_log(tmp_path, 'a.txt', es, lh)
+  f = str(tmp_path / 'a.log')
+  ma.write_store(log, f)
+  assert(ma.load_store_keys(f) == (lh, log.fn, sorted(log.get_keys())))
+  c, fn, d = ma.load_store_fields(f)
+  assert((c, fn) == (lh, log.fn))
+  counts = [(k, (le.pos, le.neg, le.total, le.flags)) for k, le in
+    log.d.items()]
+  assert(list(d.items()) == counts)
+  # Same keys and counts from the textual log and from the store
+  for g in [log.fn, f]:
+    assert(ma.get_log_keys(g, lh) == sorted(log.get_keys()))
+    assert(list(ma.get_log_counts(g, lh)[1].items()) == counts)
+  with pytest.raises(SystemExit):
+    ma.get_log_counts(f, ma.LogInc if lh == ma.Log else ma.Log)
+
+def test_store_writer_stream(tmp_path):
+  log = text_log(tmp_path, 'a.txt', entries1)
+  f = str(tmp_path / 'a.log')
+  w = ma.StoreWriter(f, 'stream', ma.Log)
+  for k in sorted(log.get_keys()):
+    w.add(k, log.get(k))
+  w.close()
+  lh, fn, it = ma.stream_store(f)
+  assert(lh == ma.Log)
+  assert(fn == 'stream')
+  l = [(k, fields(le)) for k, le in it]
+  assert(l == sorted(log_fields(log)))
+  # A store written by StoreWriter is also a log store
+  assert(sorted(log_fields(ma.load_store(f))) == l)
+
+def test_store_writer_key_order(tmp_path):
+  log = text_log(tmp_path, 'a.txt', entries1)
+  w = ma.StoreWriter(str(tmp_path / 'a.log'), 'stream', ma.Log)
+  w.add('SB', log.get('SB'))
+  with pytest.raises(AssertionError):
+    w.add('LB', log.get('LB'))
+
+def test_store_not_a_store(tmp_path):
+  f = tmp_path / 'a.txt'
+  f.write_text(entry(*entries1[0]))
+  with pytest.raises(SystemExit):
+    ma.load_store(str(f))
+
+# ------------------------------------------------------------------------------
+# Failed tests
+
+# Entry whose test failed (no numbers of outcomes), with the given failure
+# marker
+def failed_entry(name, marker):
+  return entry(name, 'warp', 'global', 0, 1).replace(
+    'Positive: 0, Negative: 1\n', marker + '\n')
+
+@pytest.mark.parametrize('marker, failed', [
+  ('Error: out of memory', True),
+  ('Assertion failed', True),
+  ('kernel Failure', True),
+  ('no marker', False)
+])
+def test_entry_failed(marker, failed):
+  es = failed_entry('MP', marker)
+  assert(ma.entry_failed(es) == failed)
+  # As when parsing the entry
+  le = ma.parse_entry((es, 'a.txt', False, None))
+  assert((type(le) == ma.FailureEntryError) == failed)
+
+def test_failed_tests_dropped(tmp_path):
+  f = str(tmp_path / 'a.txt')
+  with open(f, 'w') as fo:
+    fo.write(entry(*entries1[0]) + failed_entry('SB', 'Error: timeout') +
+      entry('Fail+assert', 'cta', 'global', 1, 1))
+  log = ma.get_logs(f, ma.Log)[0]
+  assert(list(log.get_keys()) == ['MP+membar.cta', 'Fail+assert'])
+
+# ------------------------------------------------------------------------------
+# Input formats
+
+### Write the log (see text_log()) in the given format
+def write_log(tmp_path, log, fmt):
+  f = str(tmp_path / ('a.' + fmt))
+  if fmt == 'store':
+    ma.write_store(log, f)
+  elif fmt == 'pickle':
+    with open(f, 'wb') as fo:
+      ma.pickle.dump(log, fo)
+  else:
+    with open(log.fn, 'rb') as fi, ma.log_codecs[fmt].open(f, 'wb') as fo:
+      fo.write(fi.read())
+  return f
+
+@pytest.mark.parametrize('fmt', ['text', 'store', 'pickle', 'gzip', 'bz2',
+  'xz'])
+@pytest.mark.parametrize('mapped', [False, True])
+@pytest.mark.parametrize('cache', [False, True])
+def test_input_formats(tmp_path, monkeypatch, fmt, mapped, cache):
+  log = text_log(tmp_path, 'a.txt', entries1)
+  f = log.fn if fmt == 'text' else write_log(tmp_path, log, fmt)
+  # Each input is opened once
+  opened = []
+  def open_file(fn, *args, **kwargs):
+    opened.append(fn)
+    return open(fn, *args, **kwargs)
+  monkeypatch.setattr(ma, 'open', open_file, raising=False)
+  log2 = ma.get_logs(f, ma.Log, mapped=mapped,
+    cache=str(tmp_path / 'cache') if cache else None)[0]
+  assert(opened.count(f) == 1)
+  monkeypatch.undo()
+  # Logs parsed from the (compressed) text are named after the file
+  fn = log.fn if fmt in ['store', 'pickle'] else f
+  assert(log2.fn == fn)
+  assert(all(le.parent == fn for le in log2.get_all()))
+  drop_parent = lambda l: [(k, t[:12] + t[13:]) for k, t in l]
+  assert(drop_parent(log_fields(log2)) == drop_parent(log_fields(log)))
+
+# ------------------------------------------------------------------------------
+# Parse cache
+
+### Read the textual logs (of the entries, see entry()) via the parse cache
+# Returns: the logs read via the cache and the logs read directly
+def cached_logs(tmp_path, ess, jobs, mapped):
+  fs = []
+  for i, es in enumerate(ess):
+    f = tmp_path / (str(i) + '.txt')
+    with open(str(f), 'a') as fo:
+      fo.write(''.join(entry(*e) for e in es))
+    fs.append(str(f))
+  cache = str(tmp_path / 'cache')
+  logs = ma.get_logs(fs, ma.Log, jobs=jobs, mapped=mapped, cache=cache)
+  return logs, ma.get_logs(fs, ma.Log)
+
+# Resume reading logs that have been appended to since they were cached
+@pytest.mark.parametrize('n', [1, 2])
+@pytest.mark.parametrize('jobs', [1, 2])
+@pytest.mark.parametrize('mapped', [False, True])
+def test_cache_resume(tmp_path, n, jobs, mapped):
+  ess = [entries1[:3], entries3][:n]
+  cached_logs(tmp_path, ess, jobs, mapped)
+  ess = [entries1[3:], [('RWC', 'cta', 'mixed', 2, 98)]][:n]
+  logs, logs2 = cached_logs(tmp_path, ess, jobs, mapped)
+  for log, log2 in zip(logs, logs2):
+    assert(log.fn == log2.fn)
+    # The raw texts are read from files that are still there
+    assert(all(os.path.isfile(le.rawsrc.fn) for le in log.get_all() if
+      le.rawsrc))
+    assert(log_fields(log) == log_fields(log2))
+  # Only the latest store of a log is kept
+  cache = tmp_path / 'cache'
+  assert(len(list(cache.glob('*.log'))) == n)
+  assert(len(list(cache.glob('*.checkpoint'))) == n)
+  # The logs are read from the cache as they are
+  logs, logs2 = cached_logs(tmp_path, [[]] * n, jobs, mapped)
+  assert([log_fields(log) for log in logs] ==
+    [log_fields(log) for log in logs2])
+
+# ------------------------------------------------------------------------------
+# Key patterns
+
+@pytest.mark.parametrize('classes, ks, cl', [
+  ([['MP', 'SB'], [], ['LB']], ['SB+x', 'LB', 'MP', 'R', 'xMP'],
+   [0, 2, 0, -1, -1]),
+  # Numbered backreference in the second class (refers to the group of that
+  # pattern)
+  ([['x'], ['(a)\\1']], ['aa', 'ab', 'x'], [1, -1, 0]),
+  # Named groups, also with the same name in several patterns
+  ([['(?P<c>a)(?P=c)'], ['(?P<c>b)(?P=c)']], ['aa', 'bb', 'ab'], [0, 1, -1]),
+  ([[], ['(?i)mp']], ['MP', 'mp', 'SB'], [1, 1, -1]),
+  # Groups without references (as in the axiom patterns of log2tbl)
+  ([['(MP$)|(MP\\+)'], ['LB']], ['MP', 'MP+x', 'MPx', 'LB'], [0, 0, -1, 1])
+])
+def test_classify_keys(classes, ks, cl):
+  assert(ma.classify_keys(classes, ks) == cl)
+  # Each key is in the first class with a pattern that matches it
+  assert(cl == [next((i for i, c in enumerate(classes) if any(
+    ma.re.match(r, k) for r in c)), -1) for k in ks])
+
+def test_key_matcher_combined():
+  # Patterns are combined unless they refer to groups
+  assert(ma.get_key_matcher([['(MP$)|(MP\\+)'], ['LB']]).r != None)
+  assert(ma.get_key_matcher([['x'], ['(a)\\1']]).r == None)
+
+# ------------------------------------------------------------------------------
+# Filter expressions
+
+# Key selection views (the columnar one needs numpy)
+views = [co.Rows, pytest.param(co.Columns, marks=pytest.mark.skipif(
+  co.np is None, reason='numpy is not available'))]
+
+@pytest.mark.parametrize('s', [
+  '',
+  'scope',
+  'scope=',
+  'scope=foo',
+  'mem~global',
+  'foo=1',
+  'pos=1',
+  "name~'('",
+  '(scope=warp',
+  'scope=warp)',
+  'scope=warp &',
+  'scope=warp | | mem=global',
+  '!',
+  'scope=warp mem=global',
+  'scope=warp $ mem=global'
+])
+def test_filter_parse_error(s):
+  with pytest.raises(fi.FilterError):
+    fi.Filter(s)
+  with pytest.raises(SystemExit):
+    fi.get_filter_chk(s)
+
+@pytest.mark.parametrize('s, p', [
+  # & binds stronger than |
+  ('scope=cta | scope=warp & mem=shared',
+   lambda e: e.is_cta() or (e.is_warp() and e.is_shared())),
+  ('scope=warp & mem=shared | scope=cta',
+   lambda e: (e.is_warp() and e.is_shared()) or e.is_cta()),
+  ('(scope=cta | scope=warp) & mem=shared',
+   lambda e: (e.is_cta() or e.is_warp()) and e.is_shared()),
+  # ! binds stronger than &
+  ('!scope=warp & mem=shared', lambda e: not e.is_warp() and e.is_shared()),
+  ('!(scope=warp & mem=shared)',
+   lambda e: not (e.is_warp() and e.is_shared())),
+  ('!!pos', lambda e: e.is_pos()),
+  ('scope!=warp', lambda e: not e.is_warp()),
+  ("name~'MP|IRIW' & pos", lambda e: e.name[:2] in ['MP', 'IR'] and
+   e.is_pos()),
+  ("name='SB' | short=lb", lambda e: e.name in ['SB', 'LB'])
+])
+@pytest.mark.parametrize('view', views)
+def test_filter_precedence(tmp_path, s, p, view):
+  log = text_log(tmp_path, 'a.txt', entries1)
+  f = fi.Filter(s)
+  ks = [k for k, le in log.d.items() if p(le)]
+  assert(ks == [k for k, le in log.d.items() if f(le)])
+  assert(ks == list(log.select(f).get_keys()))
+  # Selection on the view, in key order
+  assert(sorted(ks) == view([log]).get_filtered_keys(f))
+
+# Tests selected by the filter of log2tbl are the same in all logs (pos holds
+# in the first log that has the test)
+@pytest.mark.parametrize('s, ks', [
+  ('pos', ['IRIW+membar.gl', 'LB', 'MP+membar.cta', 'WRC']),
+  ('!pos', ['R', 'SB']),
+  ('scope=cta', ['SB', 'WRC'])
+])
+def test_filter_tables(tmp_path, s, ks):
+  logs = [text_log(tmp_path, '1.txt', entries1),
+    text_log(tmp_path, '2.txt', entries2)]
+  fs = [log.fn for log in logs]
+  args = argparse.Namespace(input=fs, out=str(tmp_path / 'out.html'),
+    filter=s, jobs=1, mapped=False, cache=None)
+  res = []
+  log2tbl.mux(lambda a: res.extend(a.input), args)
+  assert([log.fn for log in res] == fs)
+  for log, log2 in zip(logs, res):
+    assert(list(log2.get_keys()) == [k for k in log.get_keys() if k in ks])
+
+@pytest.mark.parametrize('s, n', [
+  ("name~'MP' & (scope=warp | scope=cta)",
+   "(scope=warp | scope=cta) & name~'MP'"),
+  ('scope=warp | mem=global & scope=cta',
+   'scope=warp | mem=global & scope=cta'),
+  ('mem=global & scope=warp & mem=global', 'mem=global & scope=warp'),
+  ('(mem=global & scope=warp) & pos', 'mem=global & scope=warp & pos'),
+  ('!!pos', 'pos'),
+  ('short=mp & scope != warp', "!scope=warp & short='mp'")
+])
+def test_filter_normalization(s, n):
+  assert(repr(fi.Filter(s)) == n)
+  assert(fi.get_filter(s) is fi.get_filter(s))
+
+# ------------------------------------------------------------------------------
+# Entry index
+
+def test_lookup_inc(tmp_path):
+  es = entries_inc + [('MP', 'warp', 'mixed', 1, 9, (False, True, False, False))]
+  log = text_log(tmp_path, 'inc.txt', es, ma.LogInc)
+  les = log.get_all()
+  g = ma.LogEntry.mem_global_bit
+  sh = ma.LogEntry.mem_shared_bit
+  warp = ma.Scope.warp
+  # All incantations, in log order
+  assert(log.lookup('mp', warp, g) == les[:2])
+  assert(log.lookup('Mp', warp, 0) == [les[3]])
+  assert(log.lookup('mp', warp, sh) == [])
+  assert(log.lookup('mp', ma.Scope.cta, g) == [])
+  # Cells of the incantation tables
+  for le in les:
+    assert(log.lookup(le.short_name, le.get_st().scope, le.get_mem(),
+      le.get_incantations()) == [le])
+  assert(log.lookup('sb', ma.Scope.cta, g, 0) == [])
+
+# ------------------------------------------------------------------------------
+# Sum of logs
+
+entries2 = [
+  ('SB', 'cta', 'shared', 7, 993),
+  ('MP+membar.cta', 'warp', 'global', 5, 995),
+  # Inconsistent with the entry in entries1 (different scope tree)
+  ('LB', 'cta', 'shared', 2, 8),
+  ('R', 'dev', 'global', 0, 10)
+]
+
+entries3 = [
+  ('R', 'dev', 'global', 4, 6),
+  ('MP+membar.cta', 'warp', 'global', 1, 999)
+]
+
+entries_inc2 = [
+  ('MP', 'warp', 'global', 1, 999, (True, False, True, True)),
+  ('SB', 'cta', 'global', 5, 995, (False, True, False, False))
+]
+
+### Sum logs of the entries with log2log sum
+# The first log is read as textual log, the others from stores
+# Returns: logs and sum log
+def sum_logs(tmp_path, ess, lh):
+  logs = []
+  fs = []
+  for i, es in enumerate(ess):
+    log = text_log(tmp_path, str(i) + '.txt', es, lh)
+    logs.append(log)
+    f = log.fn
+    if i > 0:
+      f = str(tmp_path / (str(i) + '.log'))
+      ma.write_store(log, f)
+    fs.append(f)
+  out = str(tmp_path / 'sum.log')
+  args = argparse.Namespace(input=fs, output=out, lh=lh, jobs=1, mapped=False,
+    cache=None)
+  log2log.sum(args)
+  return logs, ma.load_store(out)
+
+### Expected counts of the sum of the entries (see entry())
+# Returns: dict mapping the keys of the sum to (pos, neg, total); tests whose
+#   scope or memory class differs between the entries are dropped
+def sum_counts(ess):
+  d = dict()
+  for es in ess:
+    for e in es:
+      d.setdefault(e[0], []).append(e)
+  r = dict()
+  for k, l in d.items():
+    if all(e[1:3] == l[0][1:3] for e in l):
+      pos = sum(e[3] for e in l)
+      neg = sum(e[4] for e in l)
+      r[k] = (pos, neg, pos + neg)
+  return r
+
+@pytest.mark.parametrize('ess', [
+  [entries1, entries2, entries3],
+  [entries3, entries1],
+  [entries1, entries2]
+])
+def test_sum_stores(tmp_path, ess):
+  logs, log = sum_logs(tmp_path, ess, ma.Log)
+  counts = sum_counts(ess)
+  assert(type(log) == ma.Log)
+  assert(log.fn == 'sum')
+  assert(list(log.get_keys()) == sorted(counts))
+  for k, le in log.d.items():
+    assert((le.pos, le.neg, le.total) == counts[k])
+    # The other fields are the ones of the entry of the first log
+    ler = ma.get_entry(k, logs)
+    assert(fields(le)[:5] == fields(ler)[:5])
+    assert(le.flags == ler.flags)
+    assert(le.parent == 'sum' and le.get_raw() == '')
+
+def test_sum_inconsistent(tmp_path):
+  logs, log = sum_logs(tmp_path, [entries1, entries2], ma.Log)
+  assert(list(log.get_keys()) ==
+    ['IRIW+membar.gl', 'MP+membar.cta', 'R', 'SB', 'WRC'])
+  le = log.get('MP+membar.cta')
+  assert((le.pos, le.neg, le.total) == (15, 1985, 2000))
+
+def test_sum_stores_inc(tmp_path):
+  logs, log = sum_logs(tmp_path, [entries_inc, entries_inc2], ma.LogInc)
+  assert(type(log) == ma.LogInc)
+  ks = sorted(set(logs[0].get_keys()) | set(logs[1].get_keys()))
+  assert(list(log.get_keys()) == ks)
+  for k in ks:
+    les = [l.get(k) for l in logs if l.get(k)]
+    le = log.get(k)
+    assert((le.pos, le.neg, le.total) == (sum(e.pos for e in les),
+      sum(e.neg for e in les), sum(e.total for e in les)))
+    assert(le.get_incantations() == les[0].get_incantations())
+
+# ------------------------------------------------------------------------------
+# Best incantations
+
+# All with 5 positive outcomes but the last; by runs, incantations, and position
+# the winner of a different tie-break policy each
+entries_best = [
+  ('MP', 'warp', 'global', 5, 95, (True, True, False, False)),
+  ('MP', 'warp', 'global', 5, 145, (False, False, True, False)),
+  ('MP', 'warp', 'global', 5, 295, (True, False, True, True)),
+  ('MP', 'warp', 'global', 5, 115, (False, True, False, False)),
+  ('MP', 'warp', 'global', 2, 998, (False, False, False, False)),
+  ('SB', 'cta', 'global', 0, 100, (False, True, False, False))
+]
+
+### Best entries with log2log best
+def best_log(tmp_path, tie, keep):
+  log = text_log(tmp_path, 'inc.txt', entries_best, ma.LogInc)
+  out = str(tmp_path / 'best.log')
+  args = argparse.Namespace(input=log, output=out, tie=tie,
+    keep_incantation=keep)
+  log2log.best(args)
+  return log, ma.load_store(out)
+
+@pytest.mark.parametrize('tie, i', [
+  ('first', 0),
+  ('last', 3),
+  ('fewest', 1),
+  ('most-runs', 2)
+])
+@pytest.mark.parametrize('keep', [False, True])
+def test_best(tmp_path, tie, i, keep):
+  log, best = best_log(tmp_path, tie, keep)
+  les = log.get_all()
+  l = [les[i], les[5]]
+  assert(type(best) == (ma.LogInc if keep else ma.Log))
+  assert(best.fn == log.fn)
+  if keep:
+    # The keys record the incantations of the best entries
+    assert(list(best.get_keys()) == [log.get_key(le) for le in l])
+  else:
+    assert(list(best.get_keys()) == ['MP', 'SB'])
+  assert([fields(le) for le in best.get_all()] == [fields(le) for le in l])
+  assert([le.get_incantations() for le in best.get_all()] ==
+    [le.get_incantations() for le in l])
+
+# ------------------------------------------------------------------------------
+# Aggregation
+
+needs_numpy = pytest.mark.skipif(ag.np is None, reason='numpy is not available')
+
+### Aggregate logs with log2log reduce
+def reduce_logs(tmp_path, logs, lh, r):
+  out = str(tmp_path / (r + '.log'))
+  args = argparse.Namespace(input=logs, output=out, lh=lh, reduction=r)
+  log2log.reduce(args)
+  return ma.load_store(out)
+
+@needs_numpy
+@pytest.mark.parametrize('ess', [
+  [entries1, entries2, entries3],
+  [entries3, entries1]
+])
+def test_reduce_sum(tmp_path, ess):
+  logs, log = sum_logs(tmp_path, ess, ma.Log)
+  assert(log_fields(reduce_logs(tmp_path, logs, ma.Log, 'sum')) ==
+    log_fields(log))
+
+# Average of the rates per 100000 runs over all logs (logs that do not have a
+# test count as 0), with the total of the first log that has the test
+@pytest.mark.parametrize('ess', [
+  [entries1, entries2, entries3],
+  [entries3, entries1]
+])
+def test_avg(tmp_path, ess):
+  logs = [text_log(tmp_path, str(i) + '.txt', es) for i, es in
+    enumerate(ess)]
+  out = str(tmp_path / 'avg.log')
+  log2log.avg(argparse.Namespace(input=logs, output=out, lh=ma.Log))
+  log = ma.load_store(out)
+  ks = sorted(sum_counts(ess))
+  assert(list(log.get_keys()) == ks)
+  for k in ks:
+    l = [e for es in ess for e in es if e[0] == k]
+    le = log.get(k)
+    assert(le.pos == pytest.approx(sum(e[3] / (e[3] + e[4]) for e in l) *
+      100000 / len(ess)))
+    assert(le.neg == pytest.approx(sum(e[4] / (e[3] + e[4]) for e in l) *
+      100000 / len(ess)))
+    assert(le.total == l[0][3] + l[0][4])
+    assert(le.parent == 'avg')
+
+@needs_numpy
+def test_reduce_inc(tmp_path):
+  logs, log = sum_logs(tmp_path, [entries_inc, entries_inc2], ma.LogInc)
+  log2 = reduce_logs(tmp_path, logs, ma.LogInc, 'sum')
+  assert(type(log2) == ma.LogInc)
+  assert(log_fields(log2) == log_fields(log))
+
+# Counts of the entry with the most (or fewest) positive outcomes, of the first
+# of several such entries; tests whose scope or memory class differs between
+# the entries are dropped
+@needs_numpy
+@pytest.mark.parametrize('r, f', [('max', max), ('min', min)])
+def test_reduce_max_min(tmp_path, r, f):
+  ess = [entries1, entries2, entries3]
+  logs = [text_log(tmp_path, str(i) + '.txt', es) for i, es in
+    enumerate(ess)]
+  ks = sorted(sum_counts(ess))
+  log = reduce_logs(tmp_path, logs, ma.Log, r)
+  assert(log.fn == r)
+  assert(list(log.get_keys()) == ks)
+  for k in ks:
+    l = [e for es in ess for e in es if e[0] == k]
+    pos = f(e[3] for e in l)
+    e = next(e for e in l if e[3] == pos)
+    le = log.get(k)
+    assert((le.pos, le.neg, le.total) == (e[3], e[4], e[3] + e[4]))
+    assert(le.parent == r)
+
+def test_reduce_without_numpy(tmp_path, monkeypatch):
+  logs = [text_log(tmp_path, '1.txt', entries1),
+    text_log(tmp_path, '2.txt', entries3)]
+  monkeypatch.setattr(ag, 'np', None)
+  with pytest.raises(SystemExit):
+    reduce_logs(tmp_path, logs, ma.Log, 'sum')